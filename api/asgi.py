@@ -0,0 +1,320 @@
+"""ASGI entry point for connection-heavy endpoints.
+
+Serves chat streaming (SSE), chat long-polls and presence heartbeats as
+asyncio tasks on the same HackArenaDB as the WSGI app in index.py; every
+other route is handed to the unchanged Flask app on a worker thread. Kept
+out of index.py so the WSGI cold start never imports asyncio. The async
+routes skip Flask's request hooks, so they record into request_metrics
+themselves, under the endpoint names of their Flask views.
+
+Not deployed on Vercel, which builds only index.py. Install uvicorn from
+requirements-asgi.txt and run with: uvicorn asgi:application --app-dir api
+"""
+import asyncio
+import functools
+import io
+import json
+import sys
+from urllib.parse import parse_qsl, urlencode
+
+from index import (
+    app, db, dumps_bytes, request_metrics, ChatRoom, LONG_POLL_MAX_WAIT, PRESENCE_TTL, SSE_KEEPALIVE
+)
+
+
+# ========== CHAT WAITERS ==========
+class ChatWaiters:
+    """Chat wake-ups for asyncio tasks on one event loop.
+    
+    HackArenaDB calls notify() from whichever thread posted a message; it
+    hops onto the loop and resolves the futures parked on that room, so an
+    idle listener costs one future rather than a thread. Backends shared by
+    several processes (SQLite) are also re-checked every POLL_INTERVAL,
+    since posts made by other workers never reach this process.
+    """
+    
+    def __init__(self, loop):
+        self.loop = loop
+        self.waiters = {}
+        self.poll_interval = getattr(db.store, "POLL_INTERVAL", None)
+    
+    def notify(self, room, seq):
+        self.loop.call_soon_threadsafe(self._wake, room)
+    
+    def _wake(self, room):
+        for future in self.waiters.pop(room, ()):
+            if not future.done():
+                future.set_result(True)
+    
+    async def wait(self, room, seq, timeout, cancel=None):
+        """True once room has a message newer than seq; False on timeout or when cancel completes"""
+        deadline = self.loop.time() + timeout
+        while True:
+            future = self.loop.create_future()
+            self.waiters.setdefault(room, set()).add(future)
+            try:
+                # Registered before checking, so a post landing in between still wakes us
+                if (await run_db(db.read_messages, room, None, 0))[1] > seq:
+                    return True
+                remaining = deadline - self.loop.time()
+                if remaining <= 0:
+                    return False
+                if self.poll_interval:
+                    remaining = min(remaining, self.poll_interval)
+                await asyncio.wait(
+                    {future} if cancel is None else {future, cancel}, timeout=remaining,
+                    return_when=asyncio.FIRST_COMPLETED
+                )
+                if cancel is not None and cancel.done():
+                    return False
+            finally:
+                room_waiters = self.waiters.get(room)
+                if room_waiters is not None:
+                    room_waiters.discard(future)
+                    if not room_waiters:
+                        del self.waiters[room]
+
+
+chat_waiters = None
+
+def get_chat_waiters():
+    """The ChatWaiters of the running loop, subscribed to db chat posts"""
+    global chat_waiters
+    loop = asyncio.get_running_loop()
+    if chat_waiters is None or chat_waiters.loop is not loop:
+        if chat_waiters is not None:
+            db.listeners.remove(chat_waiters.notify)
+        chat_waiters = ChatWaiters(loop)
+        db.listeners.append(chat_waiters.notify)
+    return chat_waiters
+
+async def run_db(fn, *args):
+    """Call a db method; the in-memory store never blocks, others go to a thread"""
+    if db.store.name == "memory":
+        return fn(*args)
+    return await asyncio.to_thread(fn, *args)
+
+
+# ========== HTTP HELPERS ==========
+async def read_body(receive):
+    body = bytearray()
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            return None
+        body += message.get("body", b"")
+        if not message.get("more_body"):
+            return bytes(body)
+
+async def wait_disconnect(receive):
+    while (await receive())["type"] != "http.disconnect":
+        pass
+
+async def send_json(send, status, obj):
+    body = dumps_bytes(obj)
+    await send({"type": "http.response.start", "status": status, "headers": [
+        (b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())
+    ]})
+    await send({"type": "http.response.body", "body": body})
+
+def header(scope, name):
+    for key, value in scope["headers"]:
+        if key == name:
+            return value.decode("latin-1")
+    return None
+
+def to_number(value, kind=int, default=None):
+    try:
+        return kind(value)
+    except (TypeError, ValueError):
+        return default
+
+
+# ========== WSGI BRIDGE ==========
+def wsgi_environ(scope, body):
+    server = scope.get("server") or ("localhost", 80)
+    client = scope.get("client") or ("", 0)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", "").encode("utf-8").decode("latin-1"),
+        "PATH_INFO": scope["path"].encode("utf-8").decode("latin-1"),
+        "QUERY_STRING": scope["query_string"].decode("latin-1"),
+        "SERVER_NAME": server[0],
+        "SERVER_PORT": str(server[1]),
+        "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+        "REMOTE_ADDR": client[0],
+        "REMOTE_PORT": str(client[1]),
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": io.BytesIO(body),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": True,
+        "wsgi.run_once": False
+    }
+    for name, value in scope["headers"]:
+        key = name.decode("latin-1").upper().replace("-", "_")
+        value = value.decode("latin-1")
+        if key not in ("CONTENT_TYPE", "CONTENT_LENGTH"):
+            key = "HTTP_" + key
+        environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+def run_wsgi(environ):
+    """Run the Flask app to completion; (status, headers, body)"""
+    started = {}
+    
+    def start_response(status, headers, exc_info=None):
+        started["status"] = int(status.split(" ", 1)[0])
+        started["headers"] = [(name.lower().encode("latin-1"), value.encode("latin-1")) for name, value in headers]
+        return lambda data: None
+    
+    result = app(environ, start_response)
+    try:
+        body = b"".join(result)
+    finally:
+        if hasattr(result, "close"):
+            result.close()
+    return started["status"], started["headers"], body
+
+async def call_wsgi(scope, send, body, metered=False):
+    """Serve a request with the synchronous Flask app on a worker thread"""
+    environ = wsgi_environ(scope, body)
+    if metered:
+        # The calling async route records this request; Flask mustn't again
+        environ[request_metrics.METERED] = True
+    status, headers, body = await asyncio.to_thread(run_wsgi, environ)
+    await send({"type": "http.response.start", "status": status, "headers": headers})
+    await send({"type": "http.response.body", "body": body})
+
+
+# ========== ASYNC ROUTES ==========
+def metered(endpoint):
+    """Record an async route in request_metrics as endpoint, like Flask's hooks do for views"""
+    def decorator(route):
+        @functools.wraps(route)
+        async def wrapper(scope, receive, send, query, body):
+            if not request_metrics.enabled:
+                return await route(scope, receive, send, query, body)
+            response = {"status": None, "bytes": 0}
+            
+            async def metered_send(message):
+                if message["type"] == "http.response.start":
+                    response["status"] = message["status"]
+                else:
+                    response["bytes"] += len(message.get("body", b""))
+                await send(message)
+            
+            # Runs on the loop thread, so every route shares its shard
+            timing = request_metrics.start(endpoint)
+            try:
+                return await route(scope, receive, metered_send, query, body)
+            finally:
+                # A route that declines or loses its client sends nothing and isn't counted
+                request_metrics.finish(timing, response["status"], response["bytes"])
+        return wrapper
+    return decorator
+
+@metered("stream_messages")
+async def chat_stream(scope, receive, send, query, body):
+    """Server-Sent Events for a room, as /api/chat/stream in index.py"""
+    room = query.get("room", "#general")
+    seq = to_number(header(scope, b"last-event-id"))
+    if seq is None:
+        seq = to_number(query.get("since"))
+    if seq is None:
+        seq = (await run_db(db.read_messages, room, None, 0))[1]
+    
+    await send({"type": "http.response.start", "status": 200, "headers": [
+        (b"content-type", b"text/event-stream; charset=utf-8"),
+        (b"cache-control", b"no-cache"),
+        (b"x-accel-buffering", b"no")
+    ]})
+    await send({"type": "http.response.body", "body": b"retry: 3000\n\n", "more_body": True})
+    
+    waiters = get_chat_waiters()
+    disconnected = asyncio.ensure_future(wait_disconnect(receive))
+    try:
+        while not disconnected.done():
+            if not await waiters.wait(room, seq, SSE_KEEPALIVE, disconnected):
+                if not disconnected.done():
+                    await send({"type": "http.response.body", "body": b": keepalive\n\n", "more_body": True})
+                continue
+            events = []
+            for msg in (await run_db(db.read_messages, room, seq, ChatRoom.CAPACITY))[0]:
+                seq = msg["seq"]
+                events.append(f"id: {seq}\nevent: message\ndata: {msg.raw.decode()}\n\n")
+            await send({"type": "http.response.body", "body": "".join(events).encode(), "more_body": True})
+    finally:
+        disconnected.cancel()
+    return True
+
+@metered("get_messages")
+async def chat_messages(scope, receive, send, query, body):
+    """Hold a long-poll on the loop, then let the Flask route build the page"""
+    since = to_number(query.get("since"))
+    wait = min(max(0, to_number(query.get("wait"), float, 0)), LONG_POLL_MAX_WAIT)
+    if not wait or since is None or to_number(query.get("before")) is not None:
+        return False
+    
+    disconnected = asyncio.ensure_future(wait_disconnect(receive))
+    try:
+        await get_chat_waiters().wait(query.get("room", "#general"), since, wait, disconnected)
+        if disconnected.done():
+            return True
+    finally:
+        disconnected.cancel()
+    query = {name: value for name, value in query.items() if name != "wait"}
+    await call_wsgi(dict(scope, query_string=urlencode(query).encode()), send, body, metered=True)
+    return True
+
+@metered("heartbeat")
+async def presence_heartbeat(scope, receive, send, query, body):
+    """As /api/presence/heartbeat in index.py"""
+    data = {}
+    if (header(scope, b"content-type") or "").startswith("application/json"):
+        try:
+            data = json.loads(body or b"{}")
+        except ValueError:
+            pass
+    user = await run_db(db.heartbeat, data.get("session_id") if isinstance(data, dict) else None)
+    if user is None:
+        await send_json(send, 404, {"error": "Session expired"})
+    else:
+        await send_json(send, 200, {
+            "status": "online",
+            "username": user["username"],
+            "expires_in": PRESENCE_TTL
+        })
+    return True
+
+ASYNC_ROUTES = {
+    ("GET", "/api/chat/stream"): chat_stream,
+    ("GET", "/api/chat/messages"): chat_messages,
+    ("POST", "/api/presence/heartbeat"): presence_heartbeat
+}
+
+
+# ========== APPLICATION ==========
+async def application(scope, receive, send):
+    if scope["type"] == "lifespan":
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                get_chat_waiters()
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+    if scope["type"] != "http":
+        return
+    
+    body = await read_body(receive)
+    if body is None:
+        return
+    route = ASYNC_ROUTES.get((scope["method"], scope["path"]))
+    if route is not None:
+        query = dict(parse_qsl(scope["query_string"].decode("latin-1")))
+        if await route(scope, receive, send, query, body):
+            return
+    await call_wsgi(scope, send, body)
@@ -1,30 +1,2017 @@
-from flask import Flask, request, jsonify, render_template_string
+from flask import Flask, Response, request, jsonify, render_template_string, stream_with_context
 import os
+import sys
 import json
 import time
+import re
 import hashlib
+import gzip
 import secrets
 import random
+import functools
+import math
+import ipaddress
+import base64
+import codecs
 from datetime import datetime
-from collections import defaultdict
 import threading
+import queue
+import sqlite3
+import mmap
+import struct
+import zlib
+import atexit
+import shutil
+import tempfile
+from bisect import bisect_left, bisect_right
+from contextlib import contextmanager
+from collections import OrderedDict, deque
+from collections.abc import Mapping
+from itertools import islice, count, accumulate
+from array import array
+
+from flask.json.provider import JSONProvider
+from werkzeug.datastructures import MultiDict
+from werkzeug.middleware.proxy_fix import ProxyFix
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# ========== JSON ==========
+class JSONFragment(Mapping):
+    """An immutable JSON object encoded once, spliced verbatim into responses.
+
+    Reads like the mapping it wraps, so handlers can still index into it.
+    Fragments made with encoded() keep only the bytes and decode them on
+    access, for the many small ones served far more often than read.
+    """
+    __slots__ = ("_value", "raw")
+
+    def __init__(self, value, raw=None):
+        self._value = value
+        if raw is None:
+            # orjson returns its output in a 1KB buffer; keep an exact-size copy
+            raw = bytes(memoryview(dumps_bytes(value)))
+        self.raw = raw
+
+    @classmethod
+    def encoded(cls, value):
+        fragment = cls(value)
+        fragment._value = None
+        return fragment
+
+    @property
+    def value(self):
+        return self._value if self._value is not None else json.loads(self.raw)
+
+    def __getitem__(self, key):
+        return self.value[key]
+
+    def __iter__(self):
+        return iter(self.value)
+
+    def __len__(self):
+        return len(self.value)
+
+
+_FRAGMENT_NONCE = secrets.token_hex(6)
+_FRAGMENT_MARK = re.compile(rb'"\\u0000' + _FRAGMENT_NONCE.encode() + rb':(\d+)"')
+
+def _encode(obj, default):
+    if orjson is not None:
+        try:
+            # Non-str keys are stringified, as the json fallback does
+            return orjson.dumps(obj, default=default, option=orjson.OPT_NON_STR_KEYS)
+        except orjson.JSONEncodeError:
+            # Lone surrogates are not valid UTF-8; json below escapes them
+            # (anything else it fails on too, with json's error)
+            pass
+    text = json.dumps(obj, default=default, ensure_ascii=False, separators=(",", ":"))
+    try:
+        return text.encode()
+    except UnicodeEncodeError:
+        return json.dumps(obj, default=default, separators=(",", ":")).encode()
+
+def _is_fragment_list(value):
+    return type(value) is list and value and all(type(v) is JSONFragment for v in value)
+
+def dumps_bytes(obj):
+    """Encode obj to compact JSON bytes, splicing in JSONFragment payloads.
+
+    The common response shapes (a fragment, a list of fragments, or a flat
+    dict holding them) are joined directly. Fragments nested anywhere else
+    are encoded as placeholders and substituted afterwards.
+    """
+    if type(obj) is JSONFragment:
+        return obj.raw
+    if _is_fragment_list(obj):
+        return b"[" + b",".join(v.raw for v in obj) + b"]"
+    if type(obj) is dict and any(type(v) is JSONFragment or _is_fragment_list(v) for v in obj.values()):
+        return b"{" + b",".join(
+            _encode(str(k), None) + b":" + dumps_bytes(v) for k, v in obj.items()
+        ) + b"}"
+    
+    fragments = []
+    
+    def default(o):
+        if isinstance(o, JSONFragment):
+            fragments.append(o.raw)
+            return f"\x00{_FRAGMENT_NONCE}:{len(fragments) - 1}"
+        if isinstance(o, (set, frozenset)):
+            return list(o)
+        raise TypeError(f"Object of type {type(o).__name__} is not JSON serializable")
+    
+    raw = _encode(obj, default)
+    if fragments:
+        raw = _FRAGMENT_MARK.sub(lambda m: fragments[int(m.group(1))], raw)
+    return raw
+
+
+class FastJSONProvider(JSONProvider):
+    """App-wide JSON provider: orjson when installed, stdlib json otherwise"""
+    mimetype = "application/json"
+
+    def dumps(self, obj, **kwargs):
+        return dumps_bytes(obj).decode()
+
+    def loads(self, s, **kwargs):
+        if orjson is not None:
+            try:
+                return orjson.loads(s)
+            except orjson.JSONDecodeError:
+                # orjson rejects lone surrogate escapes that json accepts
+                pass
+        return json.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(dumps_bytes(obj), mimetype=self.mimetype)
+
 
 app = Flask(__name__)
 app.secret_key = os.environ.get('SECRET_KEY', secrets.token_hex(32))
+app.json = FastJSONProvider(app)
+if int(os.environ.get('HACKARENA_PROXY_HOPS', 0)):
+    # Behind N trusted proxies, take the client address from X-Forwarded-For
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=int(os.environ['HACKARENA_PROXY_HOPS']))
+
+# ========== LEADERBOARD INDEX ==========
+def player_id(user_id):
+    """Public id of a player: a digest of the secret session id, safe to show in cursors and URLs"""
+    return hashlib.sha256(str(user_id).encode()).hexdigest()[:16]
+
+
+class _RankNode:
+    __slots__ = ("key", "member", "entry", "forward", "span")
+
+    def __init__(self, key, member, entry, level):
+        self.key = key
+        self.member = member
+        self.entry = entry
+        self.forward = [None] * level
+        self.span = [0] * level
+
+
+class RankedIndex:
+    """Indexable skip list ordered by points (desc), ties broken by member id.
+
+    Every level link records how many nodes it jumps over, so insert, delete,
+    rank-of-member and select-by-rank are all O(log n). Reads walk the bottom
+    level from the located node and never copy the structure. A single lock
+    guards the links; it is only held for the O(log n + limit) operation.
+    """
+    MAX_LEVEL = 32
+    P = 0.25
 
-# ========== IN-MEMORY DATABASE ==========
-class HackArenaDB:
     def __init__(self):
-        self.users = {}
+        self.head = _RankNode(None, None, None, self.MAX_LEVEL)
+        self.level = 1
+        self.nodes = {}
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def __contains__(self, member):
+        return member in self.nodes
+
+    def _random_level(self):
+        level = 1
+        while level < self.MAX_LEVEL and random.random() < self.P:
+            level += 1
+        return level
+
+    def _insert(self, key, member, entry):
+        update = [self.head] * self.MAX_LEVEL
+        rank = [0] * self.MAX_LEVEL
+        x = self.head
+        for i in reversed(range(self.level)):
+            rank[i] = 0 if i == self.level - 1 else rank[i + 1]
+            while x.forward[i] is not None and x.forward[i].key < key:
+                rank[i] += x.span[i]
+                x = x.forward[i]
+            update[i] = x
+
+        level = self._random_level()
+        if level > self.level:
+            for i in range(self.level, level):
+                rank[i] = 0
+                update[i] = self.head
+                self.head.span[i] = len(self.nodes)
+            self.level = level
+
+        node = _RankNode(key, member, entry, level)
+        for i in range(level):
+            node.forward[i] = update[i].forward[i]
+            update[i].forward[i] = node
+            node.span[i] = update[i].span[i] - (rank[0] - rank[i])
+            update[i].span[i] = rank[0] - rank[i] + 1
+        for i in range(level, self.level):
+            update[i].span[i] += 1
+
+        self.nodes[member] = node
+        return node
+
+    def _delete(self, node):
+        update = [self.head] * self.MAX_LEVEL
+        x = self.head
+        for i in reversed(range(self.level)):
+            while x.forward[i] is not None and x.forward[i].key < node.key:
+                x = x.forward[i]
+            update[i] = x
+
+        for i in range(self.level):
+            if update[i].forward[i] is node:
+                update[i].span[i] += node.span[i] - 1
+                update[i].forward[i] = node.forward[i]
+            else:
+                update[i].span[i] -= 1
+        while self.level > 1 and self.head.forward[self.level - 1] is None:
+            self.level -= 1
+
+        del self.nodes[node.member]
+
+    def update(self, member, points, entry):
+        """Insert or move a member; O(log n)"""
+        key = (-points, member)
+        with self.lock:
+            node = self.nodes.get(member)
+            if node is not None:
+                if node.key == key:
+                    node.entry = entry
+                    return
+                self._delete(node)
+            self._insert(key, member, entry)
+
+    def remove(self, member):
+        with self.lock:
+            node = self.nodes.get(member)
+            if node is not None:
+                self._delete(node)
+
+    def rank(self, member):
+        """0-based position of member, or None if not ranked"""
+        with self.lock:
+            node = self.nodes.get(member)
+            if node is None:
+                return None
+            traversed = 0
+            x = self.head
+            for i in reversed(range(self.level)):
+                while x.forward[i] is not None and x.forward[i].key <= node.key:
+                    traversed += x.span[i]
+                    x = x.forward[i]
+                if x is node:
+                    return traversed - 1
+            return None
+
+    def get(self, member):
+        node = self.nodes.get(member)
+        return node.entry if node is not None else None
+
+    def _select(self, offset):
+        """Node at 0-based position offset"""
+        target = offset + 1
+        traversed = 0
+        x = self.head
+        for i in reversed(range(self.level)):
+            while x.forward[i] is not None and traversed + x.span[i] <= target:
+                traversed += x.span[i]
+                x = x.forward[i]
+            if traversed == target:
+                return x
+        return None
+
+    def _after(self, key):
+        """First node strictly after key"""
+        x = self.head
+        for i in reversed(range(self.level)):
+            while x.forward[i] is not None and x.forward[i].key <= key:
+                x = x.forward[i]
+        return x.forward[0]
+
+    @staticmethod
+    def _walk(node, limit):
+        entries = []
+        last = None
+        while node is not None and len(entries) < limit:
+            entries.append(node.entry)
+            last = node
+            node = node.forward[0]
+        return entries, last
+
+    def top(self, limit):
+        with self.lock:
+            return self._walk(self.head.forward[0], limit)[0]
+
+    def page(self, offset=0, limit=100, cursor=None):
+        """Return (entries, next_cursor); cursor takes precedence over offset"""
+        if limit <= 0:
+            return [], None
+        key = self.parse_cursor(cursor) if cursor is not None else None
+        with self.lock:
+            if key is not None:
+                node = self._after(key)
+            elif offset <= 0:
+                node = self.head.forward[0]
+            else:
+                node = self._select(offset)
+            entries, last = self._walk(node, limit)
+            if last is None or last.forward[0] is None:
+                return entries, None
+            return entries, f"{-last.key[0]}:{last.member}"
+
+    @staticmethod
+    def parse_cursor(cursor):
+        points, _, member = cursor.partition(":")
+        return (-int(points), member)
+
+
+# ========== CHAT HISTORY ==========
+TERM_PATTERN = re.compile(r"\w+")
+MAX_TERM_LENGTH = 32
+MAX_MESSAGE_TERMS = 64
+
+def tokenize(text):
+    """Distinct lowercase search terms of a message, in order of appearance"""
+    terms = dict.fromkeys(term for term in TERM_PATTERN.findall(str(text).lower()) if len(term) <= MAX_TERM_LENGTH)
+    return tuple(islice(terms, MAX_MESSAGE_TERMS))
+
+def newest(messages, limit):
+    """The limit most recent messages, newest first"""
+    return sorted(messages, key=lambda msg: msg["timestamp"], reverse=True)[:limit]
+
+
+class Postings:
+    """Ascending seqs stored as deltas in a compact array.
+
+    Entries only ever join at the tail and retire from the head, so the
+    head is advanced in place and the dead prefix is cut once it makes up
+    half of the buffer.
+    """
+    __slots__ = ("deltas", "head", "first", "last")
+
+    def __init__(self, seq):
+        self.deltas = array('I', [seq])
+        self.head = 0
+        self.first = self.last = seq
+
+    def __len__(self):
+        return len(self.deltas) - self.head
+
+    def append(self, seq):
+        self.deltas.append(seq - self.last)
+        self.last = seq
+
+    def trim(self, seq):
+        """Drop the entries up to and including seq"""
+        deltas = self.deltas
+        while self.head < len(deltas) and self.first <= seq:
+            self.head += 1
+            if self.head < len(deltas):
+                self.first += deltas[self.head]
+        if self.head * 2 >= len(deltas):
+            del deltas[:self.head]
+            self.head = 0
+
+    def seqs(self):
+        return list(accumulate(islice(self.deltas, self.head + 1, None), initial=self.first))
+
+
+class ChatIndex:
+    """Inverted index from search terms (and "@" + username) to seqs of one room"""
+    USER_PREFIX = "@"
+
+    def __init__(self):
+        self.postings = {}
+
+    @classmethod
+    def keys(cls, terms, username=None):
+        """Index keys for terms, restricted to username's messages if given"""
+        if username is None:
+            return tuple(terms)
+        return tuple(terms) + (cls.USER_PREFIX + str(username),)
+
+    def add(self, seq, keys):
+        for key in keys:
+            postings = self.postings.get(key)
+            if postings is None:
+                self.postings[key] = Postings(seq)
+            else:
+                postings.append(seq)
+
+    def remove(self, seq, keys):
+        """Retire the message at seq; it is the oldest one left under each of its keys"""
+        for key in keys:
+            postings = self.postings.get(key)
+            if postings is not None:
+                postings.trim(seq)
+                if not postings:
+                    del self.postings[key]
+
+    def search(self, keys):
+        """Ascending seqs indexed under every key"""
+        lists = []
+        for key in keys:
+            postings = self.postings.get(key)
+            if postings is None:
+                return []
+            lists.append(postings)
+        # Intersect from the shortest list so each step can only shrink it
+        lists.sort(key=len)
+        result = lists[0].seqs()
+        for postings in lists[1:]:
+            if not result:
+                break
+            result = self.intersect(result, postings.seqs())
+        return result
+
+    @staticmethod
+    def intersect(small, large):
+        """Items of small that are also in large; both ascending"""
+        found = []
+        lo = 0
+        for seq in small:
+            lo = bisect_left(large, seq, lo)
+            if lo == len(large):
+                break
+            if large[lo] == seq:
+                found.append(seq)
+        return found
+
+
+class ChatArchive:
+    """Append-only, compressed on-disk history of the messages a room's ring evicts.
+
+    Evicted messages are buffered and written as zlib blocks of
+    BLOCK_MESSAGES to numbered segment files. Memory holds only a sparse
+    index (seq range, segment and offset of each block) plus the partial
+    block; reads bisect that index and decompress just the blocks they
+    need out of an mmap of the segment. Files are opened per write and per
+    read, so idle rooms hold no descriptors.
+    """
+    BLOCK_MESSAGES = 64
+    SEGMENT_BYTES = 4 << 20
+    HEADER = struct.Struct("<QQII")  # first seq, last seq, messages, payload bytes
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.lock = threading.Lock()
+        self.block_first = array('Q')
+        self.block_last = array('Q')
+        self.block_segment = array('I')
+        self.block_offset = array('Q')
+        self.pending = []
+        self.last_seq = 0
+        self.segment = 1
+        self.segment_size = 0
+        if os.path.isdir(directory):
+            self._load()
+
+    def segment_path(self, segment):
+        return os.path.join(self.directory, f"chat.{segment:08d}.seg")
+
+    def _load(self):
+        """Rebuild the index from the segments on disk, cutting off a torn last block"""
+        segments = sorted(
+            int(name[5:-4]) for name in os.listdir(self.directory)
+            if name.startswith("chat.") and name.endswith(".seg")
+        )
+        for segment in segments:
+            path = self.segment_path(segment)
+            size = os.path.getsize(path)
+            offset = 0
+            if size:
+                with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    while offset + self.HEADER.size <= size:
+                        first, last, _, length = self.HEADER.unpack_from(mm, offset)
+                        if offset + self.HEADER.size + length > size:
+                            break
+                        self.block_first.append(first)
+                        self.block_last.append(last)
+                        self.block_segment.append(segment)
+                        self.block_offset.append(offset)
+                        offset += self.HEADER.size + length
+            if offset < size:
+                os.truncate(path, offset)
+            self.segment, self.segment_size = segment, offset
+        if self.block_last:
+            self.last_seq = self.block_last[-1]
+
+    def append(self, seq, raw):
+        """Archive one evicted message; seqs already archived (on replay) are skipped"""
+        with self.lock:
+            if seq <= self.last_seq:
+                return
+            self.pending.append((seq, raw))
+            self.last_seq = seq
+            if len(self.pending) >= self.BLOCK_MESSAGES:
+                self._write_block(sync=False)
+
+    def flush(self):
+        """Write out the partial block and fsync, e.g. before a snapshot retires the journal"""
+        with self.lock:
+            if self.pending:
+                self._write_block(sync=True)
+
+    def _write_block(self, sync):
+        seqs = array('Q', (seq for seq, _ in self.pending))
+        payload = zlib.compress(seqs.tobytes() + b"\n".join(raw for _, raw in self.pending))
+        if self.segment_size >= self.SEGMENT_BYTES:
+            self.segment += 1
+            self.segment_size = 0
+        os.makedirs(self.directory, exist_ok=True)
+        with open(self.segment_path(self.segment), 'ab') as f:
+            f.write(self.HEADER.pack(seqs[0], seqs[-1], len(seqs), len(payload)) + payload)
+            f.flush()
+            if sync:
+                os.fsync(f.fileno())
+        self.block_first.append(seqs[0])
+        self.block_last.append(seqs[-1])
+        self.block_segment.append(self.segment)
+        self.block_offset.append(self.segment_size)
+        self.segment_size += self.HEADER.size + len(payload)
+        self.pending = []
+
+    def read(self, start, end, limit):
+        """Up to limit archived messages with start <= seq <= end, newest ones, oldest first"""
+        with self.lock:
+            chunks = [[raw for seq, raw in self.pending if start <= seq <= end]]
+            i = bisect_right(self.block_first, end) - 1
+        # Index entries never change once appended, so the walk back from the
+        # last block that begins at or before end runs without the lock
+        found = len(chunks[0])
+        while i >= 0 and found < limit and self.block_last[i] >= start:
+            chunk = [raw for seq, raw in self._read_block(self.block_segment[i], self.block_offset[i])
+                     if start <= seq <= end]
+            chunks.append(chunk)
+            found += len(chunk)
+            i -= 1
+        raws = [raw for chunk in reversed(chunks) for raw in chunk][-limit:] if limit else []
+        return [JSONFragment(None, raw) for raw in raws]
+
+    def _read_block(self, segment, offset):
+        """(seq, raw) pairs of one block, decompressed from an mmap of its segment"""
+        with open(self.segment_path(segment), 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            _, _, messages, length = self.HEADER.unpack_from(mm, offset)
+            start = offset + self.HEADER.size
+            data = zlib.decompress(mm[start:start + length])
+        seqs = array('Q')
+        seqs.frombytes(data[:messages * seqs.itemsize])
+        return zip(seqs, data[messages * seqs.itemsize:].split(b"\n"))
+
+
+class ChatRoom:
+    """Fixed-capacity ring buffer of messages with monotonic sequence numbers.
+
+    Appends overwrite the oldest slot in place and reads only touch the
+    slots between the requested sequence numbers. Appends notify the room's
+    condition so long-poll and SSE readers wake without polling. Each slot
+    also remembers its index keys, so overwriting it retires the old
+    message from the room's ChatIndex without re-tokenizing, and spills it
+    to the room's ChatArchive when it has one.
+    """
+    CAPACITY = 100
+
+    def __init__(self, capacity=None, archive=None):
+        self.capacity = capacity or self.CAPACITY
+        self.slots = [None] * self.capacity
+        self.slot_keys = [None] * self.capacity
+        self.index = ChatIndex()
+        self.archive = archive
+        self.last_seq = 0
+        self.changed = threading.Condition()
+        if archive is not None and archive.last_seq:
+            # Resume after history archived by an earlier run, its newest messages back in the ring
+            for msg in archive.read(1, archive.last_seq, self.capacity):
+                self.restore(msg.value)
+
+    def __len__(self):
+        return min(self.last_seq, self.capacity)
+
+    @property
+    def first_seq(self):
+        """Oldest sequence number still retained"""
+        return max(1, self.last_seq - self.capacity + 1)
+
+    def _place(self, seq, msg, terms):
+        """Store msg in its slot and index it, retiring the message it replaces"""
+        slot = seq % self.capacity
+        if self.slot_keys[slot] is not None:
+            self.index.remove(*self.slot_keys[slot])
+            if self.archive is not None:
+                self.archive.append(self.slot_keys[slot][0], self.slots[slot].raw)
+        if terms is None:
+            terms = tokenize(msg.get("message", ""))
+        keys = ChatIndex.keys(terms, msg.get("username"))
+        self.index.add(seq, keys)
+        self.slot_keys[slot] = (seq, keys)
+        self.slots[slot] = JSONFragment(msg)
+
+    def append(self, msg, terms=None):
+        with self.changed:
+            seq = self.last_seq + 1
+            msg["seq"] = seq
+            self._place(seq, msg, terms)
+            self.last_seq = seq
+            self.changed.notify_all()
+        return seq
+
+    def extend(self, msgs, terms=None):
+        """Append several messages under one lock acquisition; their seqs"""
+        with self.changed:
+            first = self.last_seq + 1
+            for seq, msg in enumerate(msgs, first):
+                msg["seq"] = seq
+                self._place(seq, msg, terms[seq - first] if terms is not None else None)
+            self.last_seq = first + len(msgs) - 1
+            self.changed.notify_all()
+        return list(range(first, first + len(msgs)))
+
+    def restore(self, msg):
+        """Place a replayed message at its recorded seq"""
+        with self.changed:
+            if msg["seq"] > self.last_seq:
+                self._place(msg["seq"], msg, None)
+                self.last_seq = msg["seq"]
+
+    def wait(self, seq, timeout):
+        """Block until a message newer than seq exists; False on timeout"""
+        with self.changed:
+            return self.changed.wait_for(lambda: self.last_seq > seq, timeout)
+
+    def _range(self, start, end):
+        return [self.slots[seq % self.capacity] for seq in range(start, end + 1)]
+
+    def since(self, seq, limit):
+        """Up to limit messages newer than seq, oldest first"""
+        with self.changed:
+            start = max(seq + 1, self.first_seq)
+            return self._range(start, min(self.last_seq, start + limit - 1))
+
+    def tail(self, limit):
+        """The newest limit messages, oldest first"""
+        with self.changed:
+            return self._range(max(self.first_seq, self.last_seq - limit + 1), self.last_seq)
+
+    def before(self, seq, limit):
+        """Up to limit messages older than seq, oldest first, reaching into the archive past the ring"""
+        with self.changed:
+            first = self.first_seq
+            end = min(seq - 1, self.last_seq)
+            hot = self._range(max(first, end - limit + 1), end) if limit else []
+        # Everything below first was spilled before the lock was released
+        missing = limit - len(hot)
+        cold_end = min(seq, first) - 1
+        if missing <= 0 or cold_end < 1 or self.archive is None:
+            return hot
+        return self.archive.read(1, cold_end, missing) + hot
+
+    def search(self, keys, limit):
+        """Up to limit retained messages indexed under every key, newest first"""
+        with self.changed:
+            # A replay can skip seqs, leaving stale slots behind first_seq
+            seqs = [seq for seq in self.index.search(keys) if seq >= self.first_seq]
+            return [self.slots[seq % self.capacity] for seq in reversed(seqs[-limit:])] if limit else []
+
+
+# ========== PERSISTENCE ==========
+class Journal:
+    """Append-only JSON-lines log with group-commit fsync.
+
+    Writers enqueue a record and block until it is durable. A single writer
+    thread drains everything queued since its last fsync, writes the batch
+    and fsyncs once, so concurrent writers share the cost of each fsync.
+    The log is split into numbered segments; rotate() starts a new one so a
+    snapshot can retire the segments it covers.
+    """
+    MAX_BATCH = 512
+    _ROTATE = object()
+
+    def __init__(self, directory, max_batch=None):
+        self.directory = directory
+        self.max_batch = max_batch or self.MAX_BATCH
+        os.makedirs(directory, exist_ok=True)
+        segments = self.segments()
+        self.segment = segments[-1] + 1 if segments else 1
+        self.file = open(self.segment_path(self.segment), 'ab')
+        self.queue = queue.Queue()
+        self.lock = threading.Lock()
+        self.durable = threading.Condition(self.lock)
+        self.next_lsn = 0
+        self.durable_lsn = 0
+        self.closed = False
+        self.writer = threading.Thread(target=self._run, name="hackarena-journal", daemon=True)
+        self.writer.start()
+
+    def segment_path(self, segment):
+        return os.path.join(self.directory, f"journal.{segment:08d}.log")
+
+    def segments(self):
+        return sorted(
+            int(name[8:-4]) for name in os.listdir(self.directory)
+            if name.startswith("journal.") and name.endswith(".log")
+        )
+
+    def submit(self, record):
+        """Queue a record without waiting; returns its log sequence number"""
+        line = dumps_bytes(record) + b"\n"
+        with self.lock:
+            self.next_lsn += 1
+            self.queue.put((self.next_lsn, line))
+            return self.next_lsn
+
+    def wait(self, lsn):
+        """Block until every record up to lsn has been fsynced"""
+        with self.lock:
+            while self.durable_lsn < lsn and not self.closed:
+                self.durable.wait()
+
+    def append(self, record):
+        lsn = self.submit(record)
+        self.wait(lsn)
+        return lsn
+
+    def rotate(self):
+        """Start a new segment; returns its number once older ones are durable"""
+        done = threading.Event()
+        self.queue.put((self._ROTATE, done))
+        done.wait()
+        return self.segment
+
+    def close(self):
+        self.queue.put((None, None))
+        self.writer.join()
+
+    def _run(self):
+        while True:
+            batch = [self.queue.get()]
+            while len(batch) < self.max_batch:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            
+            lines = []
+            lsn = None
+            for marker, payload in batch:
+                if marker is None or marker is self._ROTATE:
+                    self._commit(lines, lsn)
+                    lines = []
+                    if marker is None:
+                        self.file.close()
+                        with self.lock:
+                            self.closed = True
+                            self.durable.notify_all()
+                        return
+                    self.file.close()
+                    self.segment += 1
+                    self.file = open(self.segment_path(self.segment), 'ab')
+                    payload.set()
+                else:
+                    lsn = marker
+                    lines.append(payload)
+            self._commit(lines, lsn)
+
+    def _commit(self, lines, lsn):
+        if not lines:
+            return
+        self.file.write(b"".join(lines))
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        with self.lock:
+            self.durable_lsn = lsn
+            self.durable.notify_all()
+
+    def replay(self, first_segment=0):
+        """Yield records from segments >= first_segment, skipping a torn tail"""
+        for segment in self.segments():
+            if segment < first_segment or segment == self.segment:
+                continue
+            with open(self.segment_path(segment), 'rb') as f:
+                for line in f:
+                    try:
+                        yield json.loads(line)
+                    except ValueError:
+                        break
+
+    def retire(self, before_segment):
+        for segment in self.segments():
+            if segment < before_segment:
+                os.remove(self.segment_path(segment))
+
+
+# ========== SESSION EXPIRY ==========
+SESSION_TTL = int(os.environ.get('HACKARENA_SESSION_TTL', 24 * 3600))
+PRESENCE_TTL = int(os.environ.get('HACKARENA_PRESENCE_TTL', 300))
+MAX_SESSIONS = int(os.environ.get('HACKARENA_MAX_SESSIONS', 100000))
+GAME_TTL = int(os.environ.get('HACKARENA_GAME_TTL', 3600))
+MAX_GAMES = int(os.environ.get('HACKARENA_MAX_GAMES', 100000))
+
+
+class ExpiryIndex:
+    """Keys ordered by last touch, each expiring ttl seconds after it.
+
+    With one TTL per index, touch order is also deadline order, so the
+    coldest key is always at the front: touching is O(1), and a sweep only
+    pops the keys that have expired or exceed capacity (LRU eviction).
+    Nothing else is visited.
+    """
+
+    def __init__(self, ttl, capacity=None):
+        self.ttl = ttl
+        self.capacity = capacity
+        self.deadlines = OrderedDict()
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.deadlines)
+
+    def __contains__(self, key):
+        return key in self.deadlines
+
+    def touch(self, key, now=None):
+        with self.lock:
+            self.deadlines[key] = (now or time.time()) + self.ttl
+            self.deadlines.move_to_end(key)
+
+    def refresh(self, key, now=None):
+        """Touch key only if it is tracked and not yet expired"""
+        now = now or time.time()
+        with self.lock:
+            if self.deadlines.get(key, 0) <= now:
+                return False
+            self.deadlines[key] = now + self.ttl
+            self.deadlines.move_to_end(key)
+            return True
+
+    def discard(self, key):
+        with self.lock:
+            self.deadlines.pop(key, None)
+
+    def pop(self, key, now=None):
+        """Remove key; True only if it was tracked and not yet expired"""
+        with self.lock:
+            return self.deadlines.pop(key, 0) > (now or time.time())
+
+    def expired(self, now=None):
+        """Pop and return keys past their deadline or beyond capacity"""
+        now = now or time.time()
+        popped = []
+        with self.lock:
+            while self.deadlines:
+                key, deadline = next(iter(self.deadlines.items()))
+                if deadline > now and (self.capacity is None or len(self.deadlines) <= self.capacity):
+                    break
+                del self.deadlines[key]
+                popped.append(key)
+        return popped
+
+    def keys(self, limit):
+        with self.lock:
+            return list(islice(reversed(self.deadlines), limit))
+
+
+# ========== SCORE AGGREGATION ==========
+class ScoreAggregator:
+    """Coalesces concurrent point awards into per-user batches.
+
+    The first submitter to find no flush running becomes the flusher: it
+    swaps out the pending totals and applies them in one call while later
+    submissions accumulate for the next batch. Everyone returns once the
+    batch holding their increment is applied, so a single request pays no
+    extra latency, and a burst on the same few users turns into one update
+    per user per batch instead of one per submission. If applying a batch
+    fails, every submitter whose points were in it gets the error.
+    """
+
+    def __init__(self, apply):
+        self.apply = apply
+        self.lock = threading.Lock()
+        self.flushed = threading.Condition(self.lock)
+        self.pending = {}
+        self.waiting = 0
+        self.batch = 0
+        self.applied = 0
+        self.flushing = False
+        self.failures = {}
+        self.submitted = 0
+        self.batches = 0
+
+    def add(self, user_id, points):
+        self.add_many({user_id: points})
+
+    def add_many(self, deltas):
+        """Queue {user_id: points} increments and wait for the batch holding them.
+
+        Raises the error that kept that batch from being applied.
+        """
+        with self.lock:
+            for user_id, points in deltas.items():
+                self.pending[user_id] = self.pending.get(user_id, 0) + points
+            self.submitted += len(deltas)
+            self.waiting += 1
+            ticket = self.batch
+            while self.applied <= ticket:
+                if self.flushing:
+                    self.flushed.wait()
+                    continue
+                self.flushing = True
+                deltas, self.pending = self.pending, {}
+                waiters, self.waiting = self.waiting, 0
+                self.batch += 1
+                self.lock.release()
+                error = None
+                try:
+                    self.apply(deltas)
+                except Exception as e:
+                    error = e
+                finally:
+                    self.lock.acquire()
+                    if error is not None:
+                        # Kept until each submitter in the batch has picked it up
+                        self.failures[self.batch] = [error, waiters]
+                    self.flushing = False
+                    self.applied = self.batch
+                    self.batches += 1
+                    self.flushed.notify_all()
+            
+            # Submissions made before the batch ticket + 1 was swapped out are in it
+            failure = self.failures.get(ticket + 1)
+            if failure is not None:
+                failure[1] -= 1
+                if not failure[1]:
+                    del self.failures[ticket + 1]
+                raise failure[0]
+
+    def stats(self):
+        with self.lock:
+            return {"submitted": self.submitted, "batches": self.batches}
+
+
+# ========== USER TABLE ==========
+class UserTable:
+    """Columnar user records keyed by session id.
+
+    Each user is a row: points, level and created time sit in typed arrays,
+    rank strings are interned behind a small code, and one dict maps a
+    session id to its row. Rows of dropped users are reused. get() builds
+    the record dict on demand, so callers see the same shape as before;
+    in-place edits of that dict are not stored, points change through
+    add_points() and set_points().
+    """
+    # Fields held in columns; any others live in a per-row dict
+    FIELDS = ("username", "points", "rank", "level", "created")
+
+    def __init__(self, users=None):
+        self.rows = {}
+        self.usernames = []
+        self.points = array('q')
+        self.levels = array('i')
+        self.created = array('d')
+        self.rank_codes = array('H')
+        self.ranks = []
+        self.rank_ids = {}
+        self.extra = {}
+        self.free = []
+        # Guards row allocation; updates of a live row are serialized by the
+        # caller's per-user lock, and reads re-check their row afterwards.
+        self.lock = threading.Lock()
+        for user_id, user in (users or {}).items():
+            self.put(user_id, user)
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __contains__(self, user_id):
+        return user_id in self.rows
+
+    def _rank_code(self, rank):
+        code = self.rank_ids.get(rank)
+        if code is None:
+            code = self.rank_ids[rank] = len(self.ranks)
+            self.ranks.append(rank)
+        return code
+
+    def _record(self, row):
+        user = {
+            "username": self.usernames[row],
+            "points": self.points[row],
+            "rank": self.ranks[self.rank_codes[row]],
+            "level": self.levels[row]
+        }
+        created = self.created[row]
+        # NaN marks a record without a created time (seeded accounts)
+        if created == created:
+            user["created"] = created
+        extra = self.extra.get(row)
+        if extra:
+            user.update(extra)
+        return user
+
+    def get(self, user_id):
+        row = self.rows.get(user_id)
+        if row is None:
+            return None
+        user = self._record(row)
+        # A drop and reuse of the row meanwhile would have unmapped user_id
+        return user if self.rows.get(user_id) == row else None
+
+    def put(self, user_id, user):
+        with self.lock:
+            row = self.rows.get(user_id)
+            if row is None:
+                if self.free:
+                    row = self.free.pop()
+                else:
+                    row = len(self.usernames)
+                    self.usernames.append(None)
+                    self.points.append(0)
+                    self.levels.append(0)
+                    self.created.append(math.nan)
+                    self.rank_codes.append(0)
+            self.usernames[row] = user["username"]
+            self.points[row] = user["points"]
+            self.rank_codes[row] = self._rank_code(user["rank"])
+            self.levels[row] = user["level"]
+            self.created[row] = user.get("created", math.nan)
+            extra = {key: value for key, value in user.items() if key not in self.FIELDS}
+            if extra:
+                self.extra[row] = extra
+            else:
+                self.extra.pop(row, None)
+            self.rows[user_id] = row
+
+    def pop(self, user_id):
+        with self.lock:
+            row = self.rows.pop(user_id, None)
+            if row is None:
+                return None
+            user = self._record(row)
+            self.usernames[row] = None
+            self.extra.pop(row, None)
+            self.free.append(row)
+            return user
+
+    def add_points(self, user_id, delta):
+        """New point total, or None for an unknown user"""
+        row = self.rows.get(user_id)
+        if row is None:
+            return None
+        self.points[row] += delta
+        return self.points[row]
+
+    def set_points(self, user_id, points):
+        row = self.rows.get(user_id)
+        if row is not None:
+            self.points[row] = points
+
+    def items(self):
+        for user_id, row in list(self.rows.items()):
+            user = self.get(user_id)
+            if user is not None:
+                yield user_id, user
+
+
+# ========== STORAGE BACKENDS ==========
+class Counters:
+    """Running totals bumped on write paths and read as a cheap snapshot.
+
+    With a journal, MemoryStore snapshots the totals and replay re-adds the
+    points awarded since. Message counts come back from the rooms' seqs.
+    Game starts and completions are not journaled, so those made after the
+    last snapshot are lost on restart.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.totals = {}
+        self.rooms = {}
+
+    def add(self, name, amount=1):
+        with self.lock:
+            self.totals[name] = self.totals.get(name, 0) + amount
+
+    def add_message(self, room, amount=1):
+        with self.lock:
+            self.totals["messages"] = self.totals.get("messages", 0) + amount
+            self.rooms[room] = self.rooms.get(room, 0) + amount
+
+    def snapshot(self):
+        with self.lock:
+            return dict(self.totals), dict(self.rooms)
+
+
+def count_fields(users, online, totals, rooms):
+    """The counts() shape shared by every storage backend"""
+    return {
+        "users": users,
+        "online": online,
+        "games_started": totals.get("games_started", 0),
+        "games_completed": totals.get("games_completed", 0),
+        "points_awarded": totals.get("points_awarded", 0),
+        "messages": totals.get("messages", 0),
+        "rooms": rooms
+    }
+
+
+class MemoryStore:
+    """In-process storage backend shared by all request threads.
+
+    Writes are synchronized per partition rather than globally: user records
+    hash onto a fixed set of striped locks, each chat room has its own lock,
+    and the leaderboard index and expiry indexes keep their own short locks.
+    Anonymous sessions and presence expire through ExpiryIndex sweeps run on
+    the write and presence-read paths. Given a chat_archive directory, each
+    room spills the messages its ring evicts to a ChatArchive under it.
+    """
+    name = "memory"
+    USER_LOCK_STRIPES = 64
+
+    def __init__(self, session_ttl=SESSION_TTL, presence_ttl=PRESENCE_TTL, max_sessions=MAX_SESSIONS,
+                 game_ttl=GAME_TTL, max_games=MAX_GAMES, chat_archive=None):
+        self.users = UserTable()
+        self.messages = {}
+        self.leaderboard = RankedIndex()
+        self.sessions = ExpiryIndex(session_ttl, max_sessions)
+        self.presence = ExpiryIndex(presence_ttl)
+        self.game_deadlines = ExpiryIndex(game_ttl, max_games)
+        self.games = {}
+        self.counters = Counters()
+        self.chat_archive = chat_archive
+        self.journal = None
+        self.user_locks = [threading.Lock() for _ in range(self.USER_LOCK_STRIPES)]
+        self.rooms_lock = threading.Lock()
+        self.rooms_created = threading.Condition()
+        self.clock = count(1)
+        self.version_stamps = {}
+
+    def bump(self, *collections):
+        """Give collections a fresh version after they changed.
+
+        Stamps come from one shared counter (next() on it is atomic), so
+        concurrent bumps never hand out a value a reader has already seen.
+        """
+        for name in collections:
+            self.version_stamps[name] = next(self.clock)
+
+    def versions(self, collections):
+        return tuple(self.version_stamps.get(name, 0) for name in collections)
+
+    def seed(self, users, leaderboard):
+        self.users = UserTable(users)
+        user_ids = {user["username"]: user_id for user_id, user in users.items()}
+        self.leaderboard = RankedIndex()
+        for entry in leaderboard:
+            member = player_id(user_ids[entry["username"]]) if entry["username"] in user_ids else entry["username"]
+            self.leaderboard.update(member, entry["points"], JSONFragment(entry))
+
+    def user_lock(self, user_id):
+        return self.user_locks[hash(user_id) % self.USER_LOCK_STRIPES]
+
+    def room(self, name):
+        """Get or create a chat room without racing concurrent creators"""
+        history = self.messages.get(name)
+        if history is None:
+            with self.rooms_lock:
+                history = self.messages.get(name)
+                if history is None:
+                    history = self.messages[name] = ChatRoom(archive=self.archive(name))
+            with self.rooms_created:
+                self.rooms_created.notify_all()
+        return history
+
+    def archive_path(self, name):
+        """The directory of a room's archive, named by a digest of the room name"""
+        return os.path.join(self.chat_archive, hashlib.sha256(name.encode()).hexdigest()[:32])
+
+    def archive(self, name):
+        if self.chat_archive is None:
+            return None
+        return ChatArchive(self.archive_path(name))
+
+    def flush_archives(self):
+        for history in list(self.messages.values()):
+            if history.archive is not None:
+                history.archive.flush()
+
+    def existing_room(self, name):
+        """A room, opened from its archive if an earlier run left one; None if it never had messages"""
+        history = self.messages.get(name)
+        if history is None and self.chat_archive is not None and os.path.isdir(self.archive_path(name)):
+            history = self.room(name)
+        return history
+
+    def add_user(self, user_id, user):
+        with self.user_lock(user_id):
+            self.users.put(user_id, user)
+            self.rank_user(user_id)
+            self.sessions.touch(user_id)
+            self.bump("users", "leaderboard")
+            lsn = self.log({"op": "user", "id": user_id, "user": user})
+        self.sync(lsn)
+        self.expire_sessions()
+
+    def drop_user(self, user_id):
+        with self.user_lock(user_id):
+            user = self.users.pop(user_id)
+            if user is None:
+                return
+            self.leaderboard.remove(player_id(user_id))
+            self.sessions.discard(user_id)
+            self.presence.discard(user["username"])
+            self.bump("users", "leaderboard", "presence")
+            lsn = self.log({"op": "drop", "id": user_id})
+        self.sync(lsn)
+
+    def expire_sessions(self):
+        """Drop expired or least-recently-seen sessions; O(number dropped)"""
+        for user_id in self.sessions.expired():
+            self.drop_user(user_id)
+
+    def heartbeat(self, user_id):
+        """Keep a session and its presence alive; None if it has expired"""
+        self.expire_sessions()
+        if not self.sessions.refresh(user_id):
+            return None
+        user = self.users.get(user_id)
+        if user is not None:
+            self.presence.touch(user["username"])
+            self.bump("presence")
+        return user
+
+    def add_points(self, user_id, score):
+        """Atomically credit points to a user and move them in the leaderboard index"""
+        with self.user_lock(user_id):
+            points = self.users.add_points(user_id, score)
+            if points is None:
+                return None
+            self.sessions.refresh(user_id)
+            self.rank_user(user_id)
+            self.bump("users", "leaderboard")
+            self.counters.add("points_awarded", score)
+            # Log the resulting total rather than the delta so replay is idempotent
+            lsn = self.log({"op": "points", "id": user_id, "points": points})
+        self.sync(lsn)
+        return points
+
+    def add_points_batch(self, deltas):
+        """Apply coalesced {user_id: points} increments, one update per user"""
+        lsn = None
+        awarded = 0
+        for user_id, score in deltas.items():
+            with self.user_lock(user_id):
+                points = self.users.add_points(user_id, score)
+                if points is None:
+                    continue
+                self.sessions.refresh(user_id)
+                awarded += score
+                self.rank_user(user_id)
+                lsn = self.log({"op": "points", "id": user_id, "points": points})
+        self.bump("users", "leaderboard")
+        self.counters.add("points_awarded", awarded)
+        # Journal records are fsynced in order, so waiting on the last covers the batch
+        self.sync(lsn)
+
+    def start_game(self, session_id, game_id, started, answer=None, owner=None):
+        """Record a handed-out game session until it is finished or expires"""
+        for expired in self.game_deadlines.expired():
+            self.games.pop(expired, None)
+        self.games[session_id] = (game_id, started, answer, owner)
+        self.game_deadlines.touch(session_id)
+        self.counters.add("games_started")
+
+    def finish_game(self, session_id, game_id, owner=None):
+        """Consume owner's session of game_id; {"started", "answer"}, or None if unknown or expired"""
+        entry = self.games.get(session_id)
+        if entry is None or entry[0] != game_id or entry[3] != owner:
+            return None
+        # Only one concurrent finisher wins the deadline pop
+        if not self.game_deadlines.pop(session_id):
+            self.games.pop(session_id, None)
+            return None
+        self.games.pop(session_id, None)
+        self.counters.add("games_completed")
+        return {"started": entry[1], "answer": entry[2]}
+
+    def get_user(self, user_id):
+        return self.users.get(user_id)
+
+    def post_message(self, room, msg, terms=None):
+        history = self.room(room)
+        # The room lock is reentrant, so appending and logging under it keeps
+        # journal order identical to seq order.
+        with history.changed:
+            seq = history.append(msg, terms)
+            self.bump("chat")
+            self.counters.add_message(room)
+            lsn = self.log({"op": "chat", "room": room, "msg": msg})
+        self.sync(lsn)
+        return seq
+
+    def post_messages(self, room, msgs, terms=None):
+        """Post several messages to a room under one acquisition of its lock"""
+        history = self.room(room)
+        with history.changed:
+            seqs = history.extend(msgs, terms)
+            self.bump("chat")
+            self.counters.add_message(room, len(msgs))
+            for msg in msgs:
+                lsn = self.log({"op": "chat", "room": room, "msg": msg})
+        self.sync(lsn)
+        return seqs
+
+    def read_messages(self, room, since, limit):
+        """(messages, last_seq) for a room; since=None reads the newest tail"""
+        history = self.existing_room(room)
+        if history is None:
+            return [], 0
+        with history.changed:
+            if since is None:
+                return history.tail(limit), history.last_seq
+            return history.since(since, limit), history.last_seq
+
+    def read_messages_before(self, room, before, limit):
+        """(messages, last_seq) for the limit messages preceding seq before"""
+        history = self.existing_room(room)
+        if history is None:
+            return [], 0
+        return history.before(before, limit), history.last_seq
+
+    def wait_messages(self, room, seq, timeout):
+        deadline = time.monotonic() + timeout
+        history = self.existing_room(room)
+        if history is None:
+            # Reads never create rooms: park until a first post creates this one
+            with self.rooms_created:
+                self.rooms_created.wait_for(lambda: room in self.messages, timeout)
+            history = self.messages.get(room)
+            if history is None:
+                return False
+        return history.wait(seq, max(0, deadline - time.monotonic()))
+
+    def search_messages(self, room, keys, limit):
+        if room is not None:
+            history = self.messages.get(room)
+            return history.search(keys, limit) if history is not None else []
+        return newest([msg for history in list(self.messages.values()) for msg in history.search(keys, limit)], limit)
+
+    def leaderboard_page(self, offset, limit, cursor=None):
+        return self.leaderboard.page(offset, limit, cursor)
+
+    def leaderboard_top(self, limit):
+        return self.leaderboard.top(limit)
+
+    def leaderboard_rank(self, member):
+        """(entry, 0-based position, total) or None"""
+        position = self.leaderboard.rank(member)
+        if position is None:
+            return None
+        return self.leaderboard.get(member), position, len(self.leaderboard)
+
+    def mark_online(self, username):
+        self.presence.touch(username)
+        self.bump("presence")
+
+    def sweep_presence(self):
+        """Drop expired presence; O(number expired)"""
+        if self.presence.expired():
+            self.bump("presence")
+
+    def online(self, limit):
+        """Most recently seen usernames and the online total"""
+        self.sweep_presence()
+        return self.presence.keys(limit), len(self.presence)
+
+    def counts(self):
+        # Sweep first so users and presence that have expired aren't counted
+        self.expire_sessions()
+        self.sweep_presence()
+        totals, rooms = self.counters.snapshot()
+        return count_fields(len(self.users), len(self.presence), totals, rooms)
+
+    def rank_user(self, user_id):
+        user = self.users.get(user_id)
+        # Entries keep only their encoded bytes; one per user adds up
+        self.leaderboard.update(player_id(user_id), user["points"], JSONFragment.encoded({
+            "username": user["username"],
+            "points": user["points"],
+            "rank": user["rank"]
+        }))
+
+    # ----- persistence -----
+    def log(self, record):
+        """Queue a journal record; callers hold the partition lock"""
+        if self.journal is not None:
+            return self.journal.submit(record)
+        return None
+
+    def sync(self, lsn):
+        """Wait for a logged record to become durable, outside any lock"""
+        if lsn is not None:
+            self.journal.wait(lsn)
+
+    def apply(self, record):
+        op = record["op"]
+        if op == "user":
+            self.users.put(record["id"], record["user"])
+            self.rank_user(record["id"])
+            self.sessions.touch(record["id"])
+        elif op == "drop":
+            self.users.pop(record["id"])
+            self.leaderboard.remove(player_id(record["id"]))
+            self.sessions.discard(record["id"])
+        elif op == "points" and record["id"] in self.users:
+            # Records carry totals; the difference is what was awarded since the snapshot
+            awarded = record["points"] - self.users.get(record["id"])["points"]
+            self.users.set_points(record["id"], record["points"])
+            self.rank_user(record["id"])
+            self.counters.add("points_awarded", awarded)
+        elif op == "chat":
+            self.room(record["room"]).restore(record["msg"])
+
+    def open_journal(self, data_dir, snapshot_interval=300):
+        """Enable persistence: restore snapshot + log tail, then journal writes"""
+        self.data_dir = data_dir
+        self.journal = Journal(data_dir)
+        first_segment = self.load_snapshot()
+        for record in self.journal.replay(first_segment):
+            self.apply(record)
+        # Restored rooms resume their message counts at the last sequence number
+        for room, history in self.messages.items():
+            self.counters.add_message(room, history.last_seq)
+        
+        if snapshot_interval:
+            self.snapshot_stop = threading.Event()
+            threading.Thread(
+                target=self._snapshot_loop, args=(snapshot_interval,),
+                name="hackarena-snapshot", daemon=True
+            ).start()
+
+    def snapshot_path(self):
+        return os.path.join(self.data_dir, "snapshot.json")
+
+    def load_snapshot(self):
+        try:
+            with open(self.snapshot_path()) as f:
+                state = json.load(f)
+        except FileNotFoundError:
+            return 0
+        
+        self.users = UserTable(state["users"])
+        for user_id, user in state["users"].items():
+            if "created" in user:
+                self.sessions.touch(user_id)
+        self.leaderboard = RankedIndex()
+        for member, entry in state["leaderboard"]:
+            # Snapshots from before player ids keyed players on their session id
+            if member in state["users"]:
+                member = player_id(member)
+            self.leaderboard.update(member, entry["points"], JSONFragment.encoded(entry))
+        self.messages = {}
+        for room, messages in state["rooms"].items():
+            for msg in messages:
+                self.room(room).restore(msg)
+        for name, value in state.get("counters", {}).items():
+            self.counters.add(name, value)
+        return state["segment"]
+
+    def snapshot(self):
+        """Write a compact snapshot and drop the log segments it covers"""
+        segment = self.journal.rotate()
+        # Records logged after the rotation may already be reflected in the
+        # captured state; replay is idempotent so applying them again is safe.
+        state = {
+            "segment": segment,
+            "users": dict(self.users.items()),
+            "leaderboard": [[member, node.entry] for member, node in list(self.leaderboard.nodes.items())],
+            "rooms": {room: history.tail(history.capacity) for room, history in list(self.messages.items())},
+            # Message counts are rebuilt from the rooms' seqs instead
+            "counters": {name: value for name, value in self.counters.snapshot()[0].items() if name != "messages"}
+        }
+        # Messages evicted from the rings are only in the retiring segments
+        # until their archives are flushed
+        self.flush_archives()
+        
+        path = self.snapshot_path()
+        with open(path + ".tmp", 'wb') as f:
+            f.write(dumps_bytes(state))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(path + ".tmp", path)
+        self.journal.retire(segment)
+
+    def _snapshot_loop(self, interval):
+        while not self.snapshot_stop.wait(interval):
+            try:
+                self.snapshot()
+            except OSError as e:
+                print(f"HackArena snapshot failed: {e}")
+
+
+
+class SQLiteStore:
+    """Cross-process storage backend on a shared SQLite database in WAL mode.
+
+    Every gunicorn worker opens the same file, so logins, points, chat and
+    presence are visible to all of them. Each thread keeps its own
+    connection; writes run in short BEGIN IMMEDIATE transactions. Waiters
+    are woken at once by sends from their own process and notice sends
+    from other workers within POLL_INTERVAL. Session and presence expiry
+    run as indexed range deletes on users.seen / presence.seen, at most
+    once per SWEEP_INTERVAL per process. Chat rows are kept for scrollback,
+    since they already live on disk; only the search index (chat_terms) is
+    trimmed to the newest history_size messages of each room.
+    """
+    name = "sqlite"
+    POLL_INTERVAL = 0.25
+    SWEEP_INTERVAL = 5
+    SCHEMA = '''
+        CREATE TABLE IF NOT EXISTS users (
+            id TEXT PRIMARY KEY, username TEXT NOT NULL, points INTEGER NOT NULL,
+            rank TEXT NOT NULL, level INTEGER NOT NULL, created REAL, seen REAL
+        );
+        CREATE INDEX IF NOT EXISTS users_seen ON users (seen) WHERE seen IS NOT NULL;
+        CREATE TABLE IF NOT EXISTS leaderboard (
+            member TEXT PRIMARY KEY, username TEXT NOT NULL,
+            points INTEGER NOT NULL, rank TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS leaderboard_order ON leaderboard (points DESC, member);
+        CREATE TABLE IF NOT EXISTS messages (
+            room TEXT NOT NULL, seq INTEGER NOT NULL, body TEXT NOT NULL,
+            PRIMARY KEY (room, seq)
+        ) WITHOUT ROWID;
+        CREATE TABLE IF NOT EXISTS presence (username TEXT PRIMARY KEY, seen REAL NOT NULL);
+        CREATE INDEX IF NOT EXISTS presence_seen ON presence (seen);
+        CREATE TABLE IF NOT EXISTS games (
+            id TEXT PRIMARY KEY, game TEXT NOT NULL, started REAL NOT NULL, answer TEXT, owner TEXT
+        ) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS games_started ON games (started);
+        CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL) WITHOUT ROWID;
+        INSERT OR IGNORE INTO counters SELECT 'users', COUNT(*) FROM users;
+        INSERT OR IGNORE INTO counters SELECT 'online', COUNT(*) FROM presence;
+        INSERT OR IGNORE INTO counters SELECT 'messages', COALESCE(SUM(seq), 0) FROM (
+            SELECT MAX(seq) AS seq FROM messages GROUP BY room
+        );
+        INSERT OR IGNORE INTO counters SELECT 'room:' || room, MAX(seq) FROM messages GROUP BY room;
+        CREATE TABLE IF NOT EXISTS chat_terms (
+            room TEXT NOT NULL, seq INTEGER NOT NULL, term TEXT NOT NULL,
+            PRIMARY KEY (room, seq, term)
+        ) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS chat_terms_lookup ON chat_terms (term, room, seq);
+        CREATE TABLE IF NOT EXISTS versions (name TEXT PRIMARY KEY, version INTEGER NOT NULL);
+        INSERT OR IGNORE INTO versions VALUES
+            ('users', 0), ('leaderboard', 0), ('chat', 0), ('presence', 0);
+    '''
+
+    def __init__(self, path, history_size=None, session_ttl=SESSION_TTL,
+                 presence_ttl=PRESENCE_TTL, max_sessions=MAX_SESSIONS, game_ttl=GAME_TTL):
+        self.path = path
+        self.history_size = history_size or ChatRoom.CAPACITY
+        self.session_ttl = session_ttl
+        self.presence_ttl = presence_ttl
+        self.max_sessions = max_sessions
+        self.game_ttl = game_ttl
+        self.next_sweep = 0
+        self.local = threading.local()
+        self.changed = threading.Condition()
+        self.conn.executescript(self.SCHEMA)
+        self._migrate()
+        self._index_history()
+
+    def _migrate(self):
+        """Bring a database created by an older version up to the current schema"""
+        with self.transaction() as conn:
+            # Players used to be keyed on their session id
+            conn.execute("UPDATE leaderboard SET member = player_id(member) WHERE member IN (SELECT id FROM users)")
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(games)")}
+            for column in ("answer", "owner"):
+                if column not in columns:
+                    conn.execute(f"ALTER TABLE games ADD COLUMN {column} TEXT")
+
+    def _index_history(self):
+        """Index chat kept by a database that predates chat_terms"""
+        with self.transaction() as conn:
+            if conn.execute("SELECT 1 FROM chat_terms LIMIT 1").fetchone() is not None:
+                return
+            for room, seq, body in conn.execute("SELECT room, seq, body FROM messages").fetchall():
+                msg = json.loads(body)
+                self._index_message(conn, room, seq, msg, None)
+
+    @staticmethod
+    def _index_message(conn, room, seq, msg, terms):
+        if terms is None:
+            terms = tokenize(msg.get("message", ""))
+        conn.executemany(
+            "INSERT OR IGNORE INTO chat_terms VALUES (?, ?, ?)",
+            [(room, seq, key) for key in ChatIndex.keys(terms, msg.get("username"))]
+        )
+
+    @property
+    def conn(self):
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.create_function("player_id", 1, player_id, deterministic=True)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self.local.conn = conn
+        return conn
+
+    @contextmanager
+    def transaction(self, mode="IMMEDIATE"):
+        conn = self.conn
+        conn.execute(f"BEGIN {mode}")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    @staticmethod
+    def _bump(conn, *collections):
+        """Version bumps commit with the write, so every worker sees them"""
+        conn.executemany(
+            "UPDATE versions SET version = version + 1 WHERE name = ?", [(name,) for name in collections]
+        )
+
+    @staticmethod
+    def _count(conn, name, amount=1):
+        """Running totals live in the database too, so all workers share them"""
+        if amount:
+            conn.execute(
+                "INSERT INTO counters VALUES (?, ?) ON CONFLICT (name) DO UPDATE SET value = value + excluded.value",
+                (name, amount)
+            )
+
+    def _touch_presence(self, conn, username, now):
+        if conn.execute("UPDATE presence SET seen = ? WHERE username = ?", (now, username)).rowcount == 0:
+            conn.execute("INSERT INTO presence VALUES (?, ?)", (username, now))
+            self._count(conn, "online")
+
+    def versions(self, collections):
+        stamps = dict(self.conn.execute("SELECT name, version FROM versions").fetchall())
+        return tuple(stamps.get(name, 0) for name in collections)
+
+    @staticmethod
+    def _entry(row):
+        return {"username": row[0], "points": row[1], "rank": row[2]}
+
+    def seed(self, users, leaderboard):
+        """Insert seed rows once; workers starting later leave existing data alone"""
+        user_ids = {user["username"]: user_id for user_id, user in users.items()}
+        with self.transaction() as conn:
+            self._count(conn, "users", conn.executemany(
+                "INSERT OR IGNORE INTO users (id, username, points, rank, level, created) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                [(user_id, u["username"], u["points"], u["rank"], u["level"], u.get("created"))
+                 for user_id, u in users.items()]
+            ).rowcount)
+            conn.executemany(
+                "INSERT OR IGNORE INTO leaderboard VALUES (?, ?, ?, ?)",
+                [(player_id(user_ids[e["username"]]) if e["username"] in user_ids else e["username"],
+                  e["username"], e["points"], e["rank"])
+                 for e in leaderboard]
+            )
+
+    def add_user(self, user_id, user):
+        with self.transaction() as conn:
+            if conn.execute("SELECT 1 FROM users WHERE id = ?", (user_id,)).fetchone() is None:
+                self._count(conn, "users")
+            conn.execute(
+                "INSERT OR REPLACE INTO users VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (user_id, user["username"], user["points"], user["rank"], user["level"],
+                 user.get("created"), time.time())
+            )
+            conn.execute(
+                "INSERT OR REPLACE INTO leaderboard VALUES (?, ?, ?, ?)",
+                (player_id(user_id), user["username"], user["points"], user["rank"])
+            )
+            self._bump(conn, "users", "leaderboard")
+        self.expire_sessions()
+
+    def expire_sessions(self, force=False):
+        """Delete expired sessions and presence, then trim to max_sessions"""
+        now = time.time()
+        if not force and now < self.next_sweep:
+            return
+        self.next_sweep = now + self.SWEEP_INTERVAL
+        with self.transaction() as conn:
+            cutoff = now - self.session_ttl
+            row = conn.execute(
+                "SELECT seen FROM users WHERE seen IS NOT NULL ORDER BY seen DESC LIMIT 1 OFFSET ?",
+                (self.max_sessions,)
+            ).fetchone()
+            if row is not None:
+                cutoff = max(cutoff, row[0])
+            conn.execute(
+                "DELETE FROM leaderboard WHERE member IN (SELECT player_id(id) FROM users WHERE seen <= ?)", (cutoff,)
+            )
+            dropped = conn.execute("DELETE FROM users WHERE seen <= ?", (cutoff,)).rowcount
+            conn.execute("DELETE FROM games WHERE started <= ?", (now - self.game_ttl,))
+            offline = conn.execute("DELETE FROM presence WHERE seen <= ?", (now - self.presence_ttl,)).rowcount
+            if offline:
+                self._count(conn, "online", -offline)
+                self._bump(conn, "presence")
+            if dropped:
+                self._count(conn, "users", -dropped)
+                self._bump(conn, "users", "leaderboard")
+
+    def heartbeat(self, user_id):
+        now = time.time()
+        with self.transaction() as conn:
+            if conn.execute(
+                "UPDATE users SET seen = ? WHERE id = ? AND seen > ?", (now, user_id, now - self.session_ttl)
+            ).rowcount == 0:
+                return None
+            username = conn.execute("SELECT username FROM users WHERE id = ?", (user_id,)).fetchone()[0]
+            self._touch_presence(conn, username, now)
+            self._bump(conn, "presence")
+        return self.get_user(user_id)
+
+    def get_user(self, user_id):
+        row = self.conn.execute(
+            "SELECT username, points, rank, level, created FROM users WHERE id = ?", (user_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        user = {"username": row[0], "points": row[1], "rank": row[2], "level": row[3]}
+        if row[4] is not None:
+            user["created"] = row[4]
+        return user
+
+    def add_points(self, user_id, score):
+        with self.transaction() as conn:
+            if conn.execute(
+                "UPDATE users SET points = points + ?, seen = CASE WHEN seen IS NULL THEN NULL ELSE ? END "
+                "WHERE id = ?", (score, time.time(), user_id)
+            ).rowcount == 0:
+                return None
+            conn.execute("UPDATE leaderboard SET points = points + ? WHERE member = ?", (score, player_id(user_id)))
+            self._bump(conn, "users", "leaderboard")
+            self._count(conn, "points_awarded", score)
+            return conn.execute("SELECT points FROM users WHERE id = ?", (user_id,)).fetchone()[0]
+
+    def add_points_batch(self, deltas):
+        now = time.time()
+        with self.transaction() as conn:
+            awarded = [
+                (score, user_id) for user_id, score in deltas.items()
+                if conn.execute(
+                    "UPDATE users SET points = points + ?, seen = CASE WHEN seen IS NULL THEN NULL ELSE ? END "
+                    "WHERE id = ?", (score, now, user_id)
+                ).rowcount
+            ]
+            conn.executemany(
+                "UPDATE leaderboard SET points = points + ? WHERE member = ?",
+                [(score, player_id(user_id)) for score, user_id in awarded]
+            )
+            self._bump(conn, "users", "leaderboard")
+            self._count(conn, "points_awarded", sum(score for score, _ in awarded))
+
+    def start_game(self, session_id, game_id, started, answer=None, owner=None):
+        with self.transaction() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO games (id, game, started, answer, owner) VALUES (?, ?, ?, ?, ?)",
+                (session_id, game_id, started, answer, owner)
+            )
+            self._count(conn, "games_started")
+        self.expire_sessions()
+
+    def finish_game(self, session_id, game_id, owner=None):
+        with self.transaction() as conn:
+            row = conn.execute(
+                "SELECT started, answer FROM games WHERE id = ? AND game = ? AND owner IS ? AND started > ?",
+                (session_id, game_id, owner, time.time() - self.game_ttl)
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute("DELETE FROM games WHERE id = ?", (session_id,))
+            self._count(conn, "games_completed")
+        return {"started": row[0], "answer": row[1]}
+
+    def leaderboard_page(self, offset, limit, cursor=None):
+        if limit <= 0:
+            return [], None
+        if cursor is not None:
+            key = RankedIndex.parse_cursor(cursor)
+            rows = self.conn.execute(
+                "SELECT username, points, rank, member FROM leaderboard "
+                "WHERE points < ? OR (points = ? AND member > ?) "
+                "ORDER BY points DESC, member LIMIT ?",
+                (-key[0], -key[0], key[1], limit + 1)
+            ).fetchall()
+        else:
+            rows = self.conn.execute(
+                "SELECT username, points, rank, member FROM leaderboard "
+                "ORDER BY points DESC, member LIMIT ? OFFSET ?",
+                (limit + 1, max(0, offset))
+            ).fetchall()
+        
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = f"{rows[-1][1]}:{rows[-1][3]}"
+        return [self._entry(row) for row in rows], next_cursor
+
+    def leaderboard_top(self, limit):
+        return self.leaderboard_page(0, limit)[0]
+
+    def leaderboard_rank(self, member):
+        with self.transaction("DEFERRED") as conn:
+            row = conn.execute(
+                "SELECT username, points, rank FROM leaderboard WHERE member = ?", (member,)
+            ).fetchone()
+            if row is None:
+                return None
+            position = conn.execute(
+                "SELECT COUNT(*) FROM leaderboard WHERE points > ? OR (points = ? AND member < ?)",
+                (row[1], row[1], member)
+            ).fetchone()[0]
+            total = conn.execute("SELECT COUNT(*) FROM leaderboard").fetchone()[0]
+        return self._entry(row), position, total
+
+    def _last_seq(self, conn, room):
+        return conn.execute("SELECT COALESCE(MAX(seq), 0) FROM messages WHERE room = ?", (room,)).fetchone()[0]
+
+    def post_message(self, room, msg, terms=None):
+        with self.transaction() as conn:
+            seq = self._last_seq(conn, room) + 1
+            msg["seq"] = seq
+            conn.execute("INSERT INTO messages VALUES (?, ?, ?)", (room, seq, dumps_bytes(msg).decode()))
+            self._index_message(conn, room, seq, msg, terms)
+            conn.execute("DELETE FROM chat_terms WHERE room = ? AND seq <= ?", (room, seq - self.history_size))
+            self._bump(conn, "chat")
+            self._count(conn, "messages")
+            self._count(conn, "room:" + room)
+        with self.changed:
+            self.changed.notify_all()
+        return seq
+
+    def post_messages(self, room, msgs, terms=None):
+        with self.transaction() as conn:
+            first = self._last_seq(conn, room) + 1
+            rows = []
+            for seq, msg in enumerate(msgs, first):
+                msg["seq"] = seq
+                rows.append((room, seq, dumps_bytes(msg).decode()))
+                self._index_message(conn, room, seq, msg, terms[seq - first] if terms is not None else None)
+            conn.executemany("INSERT INTO messages VALUES (?, ?, ?)", rows)
+            retained = first + len(msgs) - 1 - self.history_size
+            conn.execute("DELETE FROM chat_terms WHERE room = ? AND seq <= ?", (room, retained))
+            self._bump(conn, "chat")
+            self._count(conn, "messages", len(msgs))
+            self._count(conn, "room:" + room, len(msgs))
+        with self.changed:
+            self.changed.notify_all()
+        return list(range(first, first + len(msgs)))
+
+    def read_messages(self, room, since, limit):
+        with self.transaction("DEFERRED") as conn:
+            last_seq = self._last_seq(conn, room)
+            if since is None:
+                rows = conn.execute(
+                    "SELECT body FROM messages WHERE room = ? ORDER BY seq DESC LIMIT ?", (room, limit)
+                ).fetchall()[::-1]
+            else:
+                # Older messages stay on disk for before=, but since= sees
+                # only the last CAPACITY, as a ChatRoom ring would
+                rows = conn.execute(
+                    "SELECT body FROM messages WHERE room = ? AND seq > ? ORDER BY seq LIMIT ?",
+                    (room, max(since, last_seq - ChatRoom.CAPACITY), limit)
+                ).fetchall()
+        return [JSONFragment(json.loads(row[0]), row[0].encode()) for row in rows], last_seq
+
+    def read_messages_before(self, room, before, limit):
+        with self.transaction("DEFERRED") as conn:
+            last_seq = self._last_seq(conn, room)
+            rows = conn.execute(
+                "SELECT body FROM messages WHERE room = ? AND seq < ? ORDER BY seq DESC LIMIT ?", (room, before, limit)
+            ).fetchall()[::-1]
+        return [JSONFragment(json.loads(row[0]), row[0].encode()) for row in rows], last_seq
+
+    def search_messages(self, room, keys, limit):
+        keys = tuple(dict.fromkeys(keys))
+        matches = (
+            f"SELECT room, seq FROM chat_terms WHERE term IN ({', '.join('?' * len(keys))})"
+            f"{' AND room = ?' if room is not None else ''} GROUP BY room, seq HAVING COUNT(*) = ?"
+        )
+        params = keys + ((room,) if room is not None else ()) + (len(keys),)
+        with self.transaction("DEFERRED") as conn:
+            rows = conn.execute(
+                f"SELECT m.body FROM ({matches}) t JOIN messages m ON m.room = t.room AND m.seq = t.seq "
+                f"ORDER BY m.seq DESC" + (" LIMIT ?" if room is not None else ""),
+                params + ((limit,) if room is not None else ())
+            ).fetchall()
+        return newest([JSONFragment(json.loads(row[0]), row[0].encode()) for row in rows], limit)
+
+    def wait_messages(self, room, seq, timeout):
+        deadline = time.monotonic() + timeout
+        while self._last_seq(self.conn, room) <= seq:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            with self.changed:
+                self.changed.wait(min(remaining, self.POLL_INTERVAL))
+        return True
+
+    def mark_online(self, username):
+        with self.transaction() as conn:
+            self._touch_presence(conn, username, time.time())
+            self._bump(conn, "presence")
+
+    def online(self, limit):
+        cutoff = time.time() - self.presence_ttl
+        with self.transaction("DEFERRED") as conn:
+            names = [row[0] for row in conn.execute(
+                "SELECT username FROM presence WHERE seen > ? ORDER BY seen DESC LIMIT ?", (cutoff, limit)
+            )]
+            total = conn.execute("SELECT COUNT(*) FROM presence WHERE seen > ?", (cutoff,)).fetchone()[0]
+        return names, total
+
+    def counts(self):
+        # The online and users counters only drop when expired rows are swept
+        self.expire_sessions()
+        totals = dict(self.conn.execute("SELECT name, value FROM counters").fetchall())
+        rooms = {name[5:]: totals.pop(name) for name in list(totals) if name.startswith("room:")}
+        return count_fields(totals.get("users", 0), totals.get("online", 0), totals, rooms)
+
+
+# ========== STARTUP SNAPSHOT ==========
+STARTUP_SNAPSHOT = os.environ.get(
+    'HACKARENA_STARTUP_SNAPSHOT',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data', 'startup.json')
+)
+
+def source_digest():
+    """Digest of this module's source; a startup snapshot is only valid for the code that built it"""
+    with open(__file__, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+def load_startup_snapshot(path=STARTUP_SNAPSHOT):
+    """Prebuilt seed data and compressed pages from scripts/build_startup_snapshot.py, or {}"""
+    try:
+        with open(path, 'rb') as f:
+            snapshot = json.loads(f.read())
+    except (OSError, ValueError):
+        return {}
+    if snapshot.get("source") != source_digest():
+        print(f"HackArena: ignoring stale startup snapshot {path}")
+        return {}
+    return snapshot
+
+startup_snapshot = load_startup_snapshot()
+
+# ========== DATABASE ==========
+class HackArenaDB:
+    """Application data facade; state lives in a pluggable storage backend"""
+
+    def __init__(self, store=None, seed=None):
+        self.store = store if store is not None else MemoryStore()
+        self.scores = ScoreAggregator(self.store.add_points_batch)
+        # Callables run as listener(room, seq) after every chat post (see asgi.py)
+        self.listeners = []
         self.games = {}
-        self.messages = defaultdict(list)
-        self.leaderboard = []
-        self.online_users = set()
-        self.init_default_data()
+        self.init_default_data(seed)
+    
+    def init_default_data(self, seed=None):
+        if seed is None:
+            seed = self.default_seed()
+        self.store.seed(seed["users"], seed["leaderboard"])
+        self.games = seed["games"]
     
-    def init_default_data(self):
+    @staticmethod
+    def default_seed():
         # Default users
-        self.users = {
+        users = {
             "admin": {"username": "admin", "points": 1500, "rank": "👑 Elite Hacker", "level": 99},
             "ghost": {"username": "ghost_1337", "points": 800, "rank": "👻 Ghost", "level": 42},
             "crypto": {"username": "crypto_master", "points": 650, "rank": "🔐 Cryptographer", "level": 35},
@@ -32,7 +2019,7 @@ class HackArenaDB:
         }
         
         # Default leaderboard
-        self.leaderboard = [
+        leaderboard = [
             {"username": "admin", "points": 1500, "rank": "👑 Elite Hacker"},
             {"username": "ghost_1337", "points": 800, "rank": "👻 Ghost"},
             {"username": "crypto_master", "points": 650, "rank": "🔐 Cryptographer"},
@@ -46,7 +2033,7 @@ class HackArenaDB:
         ]
         
         # Default games
-        self.games = {
+        games = {
             "password_cracker": {
                 "name": "🔐 Password Cracker",
                 "description": "Crack MD5 hashes to find passwords",
@@ -78,8 +2065,119 @@ class HackArenaDB:
                 "points": 500
             }
         }
+        return {"users": users, "leaderboard": leaderboard, "games": games}
+
+    def add_user(self, user_id, user):
+        self.store.add_user(user_id, user)
+
+    def get_user(self, user_id):
+        return self.store.get_user(user_id)
+
+    def add_points(self, user_id, score):
+        return self.store.add_points(user_id, score)
+
+    def submit_score(self, user_id, score):
+        """Credit validated game points through the batching aggregator"""
+        self.scores.add(user_id, score)
+
+    def submit_scores(self, deltas):
+        """Credit several users' {user_id: points} in one aggregator batch"""
+        self.scores.add_many(deltas)
+
+    def start_game(self, session_id, game_id, started, answer=None, owner=None):
+        self.store.start_game(session_id, game_id, started, answer, owner)
+
+    def finish_game(self, session_id, game_id, owner=None):
+        return self.store.finish_game(session_id, game_id, owner)
+
+    def heartbeat(self, user_id):
+        return self.store.heartbeat(user_id)
+
+    def leaderboard_page(self, offset=0, limit=100, cursor=None):
+        return self.store.leaderboard_page(offset, limit, cursor)
+
+    def leaderboard_top(self, limit):
+        return self.store.leaderboard_top(limit)
+
+    def leaderboard_rank(self, player):
+        return self.store.leaderboard_rank(player)
+
+    def post_message(self, room, msg, terms=None):
+        """Post msg to room; terms are its tokenize()d search terms, if already known"""
+        seq = self.store.post_message(room, msg, terms)
+        for listener in self.listeners:
+            listener(room, seq)
+        return seq
+
+    def post_messages(self, room, msgs, terms=None):
+        seqs = self.store.post_messages(room, msgs, terms)
+        for listener in self.listeners:
+            listener(room, seqs[-1])
+        return seqs
+
+    def read_messages(self, room, since=None, limit=50):
+        return self.store.read_messages(room, since, limit)
+
+    def read_messages_before(self, room, before, limit=50):
+        return self.store.read_messages_before(room, before, limit)
+
+    def wait_messages(self, room, seq, timeout):
+        return self.store.wait_messages(room, seq, timeout)
+
+    def search_messages(self, terms, user=None, room=None, limit=20):
+        """Newest retained messages containing every term, optionally by user and in one room"""
+        return self.store.search_messages(room, ChatIndex.keys(terms, user), limit)
 
-db = HackArenaDB()
+    def mark_online(self, username):
+        self.store.mark_online(username)
+
+    def online(self, limit):
+        return self.store.online(limit)
+
+    def counts(self):
+        return self.store.counts()
+
+    def versions(self, collections):
+        """Current version stamps of the named collections"""
+        return self.store.versions(collections)
+
+
+def create_db():
+    """Build the database from HACKARENA_STORAGE ("memory" or "sqlite:<path>")"""
+    storage = os.environ.get('HACKARENA_STORAGE', 'memory')
+    seed = startup_snapshot.get("seed")
+    if storage.startswith('sqlite:'):
+        return HackArenaDB(SQLiteStore(storage[len('sqlite:'):]), seed)
+    
+    # Chat history spilled out of the rings goes to HACKARENA_CHAT_ARCHIVE
+    # ("" keeps only the rings), else beside the journal, else to a temporary
+    # directory that lives as long as the process, like the rest of its state.
+    chat_archive = os.environ.get('HACKARENA_CHAT_ARCHIVE')
+    if chat_archive is None and os.environ.get('HACKARENA_DATA_DIR'):
+        chat_archive = os.path.join(os.environ['HACKARENA_DATA_DIR'], 'chat')
+    temporary = chat_archive is None
+    if temporary:
+        chat_archive = os.path.join(tempfile.gettempdir(), f"hackarena-chat-{secrets.token_hex(6)}")
+        atexit.register(shutil.rmtree, chat_archive, True)
+    store = MemoryStore(chat_archive=chat_archive or None)
+    if chat_archive and not temporary:
+        # A restart resumes each room after its archive, so write out the partial blocks on exit
+        atexit.register(store.flush_archives)
+    hackarena_db = HackArenaDB(store, seed)
+    if os.environ.get('HACKARENA_DATA_DIR'):
+        store.open_journal(
+            os.environ['HACKARENA_DATA_DIR'],
+            int(os.environ.get('HACKARENA_SNAPSHOT_INTERVAL', 300))
+        )
+    return hackarena_db
+
+db = create_db()
+
+LEADERBOARD_PAGE_SIZE = 100
+LONG_POLL_MAX_WAIT = 25
+SSE_KEEPALIVE = 15
+CHAT_SEARCH_MAX_RESULTS = 100
+CHAT_SCROLLBACK_MAX = 500
 
 # ========== HTML TEMPLATES ==========
 MAIN_PAGE = '''
@@ -409,10 +2507,15 @@ MAIN_PAGE = '''
         
         setInterval(drawMatrix, 35);
         
-        // Load leaderboard
-        fetch('/api/leaderboard?limit=5')
+        // Load leaderboard and stats in one round trip
+        fetch('/api/batch', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ ops: [{ op: 'leaderboard', limit: 5 }, { op: 'stats' }] })
+        })
             .then(r => r.json())
-            .then(data => {
+            .then(({ results: [leaderboard, stats] }) => {
+                const data = leaderboard.body.entries;
                 const preview = document.getElementById('leaderboard-preview');
                 preview.innerHTML = data.slice(0, 3).map((user, i) => `
                     <p>${i + 1}. ${user.username} - ${user.points}pts (${user.rank})</p>
@@ -427,14 +2530,9 @@ MAIN_PAGE = '''
                         <td>${user.rank}</td>
                     </tr>
                 `).join('');
-            });
-        
-        // Load stats
-        fetch('/api/stats')
-            .then(r => r.json())
-            .then(stats => {
-                document.getElementById('player-count').textContent = stats.total_players;
-                document.getElementById('uptime').textContent = stats.uptime;
+                
+                document.getElementById('player-count').textContent = stats.body.total_players;
+                document.getElementById('uptime').textContent = stats.body.uptime;
             });
         
         // Anonymous login
@@ -456,69 +2554,1058 @@ MAIN_PAGE = '''
 </html>
 '''
 
+# ========== PRE-RENDERED PAGES ==========
+class StaticPage:
+    """A page rendered once and kept as precompressed variants.
+
+    Each encoding gets its own strong ETag, so conditional GETs resolve to a
+    304 without touching the body, and negotiation is a dict lookup.
+    """
+    ENCODINGS = ("br", "gzip")
+    # Brotli's top quality costs ~25ms per page at import; a cold start uses
+    # a fast level unless a startup snapshot supplies the quality 11 bodies.
+    BROTLI_QUALITY = 5
+
+    def __init__(self, html, max_age=300, prebuilt=None):
+        body = html.encode()
+        tag = hashlib.sha256(body).hexdigest()[:20]
+        prebuilt = prebuilt or {}
+        self.variants = {
+            "identity": (body, tag),
+            "gzip": (prebuilt.get("gzip") or gzip.compress(body, 9, mtime=0), f"{tag}-gz")
+        }
+        if "br" in prebuilt:
+            self.variants["br"] = (prebuilt["br"], f"{tag}-br11")
+        elif brotli is not None:
+            self.variants["br"] = (brotli.compress(body, quality=self.BROTLI_QUALITY), f"{tag}-br")
+        self.cache_control = f"public, max-age={max_age}"
+
+    @staticmethod
+    def compress(html):
+        """Best-effort compressed bodies for a startup snapshot"""
+        body = html.encode()
+        variants = {"gzip": gzip.compress(body, 9, mtime=0)}
+        if brotli is not None:
+            variants["br"] = brotli.compress(body, quality=11)
+        return variants
+
+    def negotiate(self, accept_encodings):
+        best, best_q = "identity", 0
+        for encoding in self.ENCODINGS:
+            q = accept_encodings.quality(encoding)
+            if encoding in self.variants and q > best_q:
+                best, best_q = encoding, q
+        return best
+
+    def response(self, req):
+        encoding = self.negotiate(req.accept_encodings)
+        body, etag = self.variants[encoding]
+        
+        if req.if_none_match.contains_weak(etag):
+            response = Response(status=304)
+        else:
+            response = Response(body, mimetype='text/html')
+            if encoding != "identity":
+                response.headers['Content-Encoding'] = encoding
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = self.cache_control
+        response.headers['Vary'] = 'Accept-Encoding'
+        return response
+
+def render_main_page():
+    with app.app_context():
+        return render_template_string(MAIN_PAGE)
+
+main_page = StaticPage(render_main_page(), prebuilt={
+    encoding: base64.b64decode(body) for encoding, body in startup_snapshot.get("pages", {}).get("/", {}).items()
+})
+
+# ========== RESPONSE CACHE ==========
+class ResponseCache:
+    """Bounded LRU of serialized responses tagged with collection versions.
+
+    An entry is only served while the versions of the collections it was
+    built from are unchanged (and, optionally, while it is younger than its
+    ttl), so writers never have to invalidate anything explicitly.
+    """
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, stamp):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[0] != stamp or (entry[1] and entry[1] < time.monotonic()):
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[2]
+
+    def put(self, key, stamp, ttl, value):
+        expires = time.monotonic() + ttl if ttl else None
+        with self.lock:
+            self.entries[key] = (stamp, expires, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def stats(self):
+        return {
+            "entries": len(self.entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses
+        }
+
+response_cache = ResponseCache()
+
+def cached(*collections, ttl=None):
+    """Serve a view from response_cache until the given collections change"""
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            key = (request.path, tuple(sorted(request.args.items(multi=True))))
+            # Read versions before building the response: a write that lands
+            # meanwhile bumps them and the entry is simply never served.
+            stamp = db.versions(collections)
+            hit = response_cache.get(key, stamp)
+            if hit is not None:
+                body, status, headers = hit
+                return Response(body, status, headers)
+            
+            response = app.make_response(view(*args, **kwargs))
+            if response.status_code == 200 and not response.is_streamed:
+                response_cache.put(key, stamp, ttl, (
+                    response.get_data(), response.status_code, response.headers.to_wsgi_list()
+                ))
+            return response
+        return wrapper
+    return decorator
+
+CHAT_PAGE_TTL = 2
+
+# ========== REQUEST METRICS ==========
+class _RouteSeries:
+    __slots__ = ("buckets", "seconds", "inflight", "bytes", "statuses")
+
+    def __init__(self, size):
+        self.buckets = [0] * size
+        self.seconds = 0.0
+        self.inflight = 0
+        self.bytes = 0
+        self.statuses = {}
+
+    def merge(self, other):
+        for i, n in enumerate(other.buckets):
+            self.buckets[i] += n
+        self.seconds += other.seconds
+        self.inflight += other.inflight
+        self.bytes += other.bytes
+        for status, n in list(other.statuses.items()):
+            self.statuses[status] = self.statuses.get(status, 0) + n
+
+
+class RequestMetrics:
+    """Per-endpoint latency histograms, in-flight gauges and response sizes.
+
+    Each request thread records into its own shard, so the request path
+    takes no lock. A scrape merges the shards, folding those of finished
+    threads into a retired total so per-request threads don't pile up.
+    The ASGI entry records its async routes through start() and finish()
+    on its event loop thread. Buckets are fixed powers of two from 100us
+    to about 13s.
+    """
+    BUCKETS = tuple(0.0001 * 2 ** i for i in range(18))
+    METERED = "hackarena.metered"
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.local = threading.local()
+        self.shards = []
+        self.retired = {}
+        self.lock = threading.Lock()
+
+    def series(self, endpoint):
+        shard = getattr(self.local, "shard", None)
+        if shard is None:
+            shard = self.local.shard = {}
+            with self.lock:
+                self.shards.append((threading.current_thread(), shard))
+        series = shard.get(endpoint)
+        if series is None:
+            series = shard[endpoint] = _RouteSeries(len(self.BUCKETS) + 1)
+        return series
+
+    def start(self, endpoint):
+        """Count a request in flight; pass the result to finish()"""
+        series = self.series(endpoint)
+        series.inflight += 1
+        return series, time.perf_counter()
+
+    def finish(self, timing, status, size):
+        """Record a request begun by start(); status None means no response was sent"""
+        series, started = timing
+        series.inflight -= 1
+        if status is None:
+            return
+        elapsed = time.perf_counter() - started
+        series.buckets[bisect_left(self.BUCKETS, elapsed)] += 1
+        series.seconds += elapsed
+        series.bytes += size
+        series.statuses[status] = series.statuses.get(status, 0) + 1
+
+    def before_request(self):
+        # Requests the ASGI entry already meters set METERED in their environ
+        if self.enabled and not request.environ.get(self.METERED):
+            self.local.timing = self.start(request.endpoint or "unmatched")
+
+    def after_request(self, response):
+        # A WSGI request runs start to finish on one thread, so the timing
+        # stashed by before_request sits in the same thread-local.
+        timing = getattr(self.local, "timing", None)
+        if timing is not None:
+            self.local.timing = None
+            self.finish(timing, response.status_code, response.calculate_content_length() or 0)
+        return response
+
+    def install(self, app):
+        app.before_request(self.before_request)
+        app.after_request(self.after_request)
+
+    def collect(self):
+        """Merged {endpoint: _RouteSeries} across all threads"""
+        with self.lock:
+            live = []
+            for thread, shard in self.shards:
+                if thread.is_alive():
+                    live.append((thread, shard))
+                else:
+                    for endpoint, series in shard.items():
+                        self.retired.setdefault(endpoint, _RouteSeries(len(self.BUCKETS) + 1)).merge(series)
+            self.shards = live
+            
+            merged = {}
+            for endpoint, series in self.retired.items():
+                merged.setdefault(endpoint, _RouteSeries(len(self.BUCKETS) + 1)).merge(series)
+            for _, shard in live:
+                for endpoint, series in list(shard.items()):
+                    merged.setdefault(endpoint, _RouteSeries(len(self.BUCKETS) + 1)).merge(series)
+        return merged
+
+    def render(self):
+        """Prometheus text exposition format"""
+        merged = sorted(self.collect().items())
+        lines = [
+            "# HELP hackarena_request_duration_seconds Request latency by endpoint.",
+            "# TYPE hackarena_request_duration_seconds histogram"
+        ]
+        for endpoint, series in merged:
+            cumulative = 0
+            for bound, n in zip(self.BUCKETS + ("+Inf",), series.buckets):
+                cumulative += n
+                le = bound if isinstance(bound, str) else f"{bound:g}"
+                lines.append(f'hackarena_request_duration_seconds_bucket{{endpoint="{endpoint}",le="{le}"}} {cumulative}')
+            lines.append(f'hackarena_request_duration_seconds_sum{{endpoint="{endpoint}"}} {series.seconds:.6f}')
+            lines.append(f'hackarena_request_duration_seconds_count{{endpoint="{endpoint}"}} {cumulative}')
+        
+        lines += [
+            "# HELP hackarena_requests_in_flight Requests currently being handled.",
+            "# TYPE hackarena_requests_in_flight gauge"
+        ]
+        lines += [f'hackarena_requests_in_flight{{endpoint="{endpoint}"}} {series.inflight}' for endpoint, series in merged]
+        lines += [
+            "# HELP hackarena_response_bytes_total Response body bytes sent.",
+            "# TYPE hackarena_response_bytes_total counter"
+        ]
+        lines += [f'hackarena_response_bytes_total{{endpoint="{endpoint}"}} {series.bytes}' for endpoint, series in merged]
+        lines += [
+            "# HELP hackarena_responses_total Responses by endpoint and status code.",
+            "# TYPE hackarena_responses_total counter"
+        ]
+        for endpoint, series in merged:
+            for status, n in sorted(series.statuses.items()):
+                lines.append(f'hackarena_responses_total{{endpoint="{endpoint}",status="{status}"}} {n}')
+        return "\n".join(lines) + "\n"
+
+request_metrics = RequestMetrics(os.environ.get('HACKARENA_METRICS', '1') != '0')
+request_metrics.install(app)
+
+# ========== PROFILER ==========
+class SamplingProfiler:
+    """On-demand stack sampler over every thread of this worker.
+
+    Nothing is installed while idle: start() spawns a daemon thread that
+    reads sys._current_frames() at a fixed interval and counts collapsed
+    stacks (root first, joined by ';', prefixed with the thread name), the
+    input format of flamegraph.pl and speedscope. Requests never wait on a
+    capture, so it works under sync workers and the gunicorn timeout; the
+    last finished capture is kept until the next one is started. At most
+    max_stacks distinct stacks are kept; further new stacks are counted
+    under a single overflow line. One capture runs at a time per worker.
+    """
+    MAX_SECONDS = 60
+    OVERFLOW = "[other stacks]"
+
+    def __init__(self, max_stacks=20000):
+        self.max_stacks = max_stacks
+        self.running = threading.Lock()
+        self.labels = {}
+        self.thread = None
+        self.result = None
+
+    def label(self, code):
+        label = self.labels.get(code)
+        if label is None:
+            label = self.labels[code] = f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+        return label
+
+    def start(self, seconds, interval=0.01):
+        """Begin a capture in the background; False if one is already running"""
+        if not self.running.acquire(blocking=False):
+            return False
+        self.result = None
+        self.thread = threading.Thread(target=self.capture, args=(min(seconds, self.MAX_SECONDS), interval),
+                                       name="profiler", daemon=True)
+        self.thread.start()
+        return True
+
+    def busy(self):
+        return self.running.locked()
+
+    def capture(self, seconds, interval):
+        """Sampling loop of the profiler thread; leaves (stacks, samples) in result"""
+        try:
+            me = threading.get_ident()
+            stacks = {}
+            samples = 0
+            deadline = time.perf_counter() + seconds
+            while time.perf_counter() < deadline:
+                names = {thread.ident: thread.name for thread in threading.enumerate()}
+                for ident, frame in sys._current_frames().items():
+                    if ident == me:
+                        continue
+                    labels = []
+                    while frame is not None:
+                        labels.append(self.label(frame.f_code))
+                        frame = frame.f_back
+                    labels.append(names.get(ident, str(ident)))
+                    stack = ";".join(reversed(labels))
+                    if stack not in stacks and len(stacks) >= self.max_stacks:
+                        stack = self.OVERFLOW
+                    stacks[stack] = stacks.get(stack, 0) + 1
+                samples += 1
+                time.sleep(interval)
+            self.result = (stacks, samples)
+        finally:
+            self.labels.clear()
+            self.running.release()
+
+    @staticmethod
+    def collapsed(stacks):
+        return "".join(f"{stack} {n}\n" for stack, n in sorted(stacks.items(), key=lambda item: -item[1]))
+
+profiler = SamplingProfiler()
+
+ADMIN_TOKEN = os.environ.get('HACKARENA_ADMIN_TOKEN')
+
+def admin_required(view):
+    """Allow a view only with the X-Admin-Token matching HACKARENA_ADMIN_TOKEN"""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        token = request.headers.get("X-Admin-Token", "")
+        if not ADMIN_TOKEN or not secrets.compare_digest(token.encode(), ADMIN_TOKEN.encode()):
+            return jsonify({"error": "Forbidden"}), 403
+        return view(*args, **kwargs)
+    return wrapper
+
+# ========== RATE LIMITING ==========
+class TokenBuckets:
+    """Token buckets per key, held in a fixed number of bounded LRU stripes.
+
+    A key hashes onto one of STRIPES OrderedDicts, each with its own lock and
+    a share of the capacity, so a check is O(1) and never serializes on a
+    global lock. A full stripe evicts its least recently used bucket; an
+    evicted key simply starts again with a full bucket, which keeps memory
+    flat under a flood of spoofed addresses without locking out anyone.
+    """
+    STRIPES = 64
+
+    def __init__(self, capacity=65536, enabled=True):
+        self.enabled = enabled
+        self.stripe_capacity = max(1, capacity // self.STRIPES)
+        self.stripes = [(threading.Lock(), OrderedDict()) for _ in range(self.STRIPES)]
+        self.limited = [0] * self.STRIPES
+
+    def take(self, key, rate, burst, now=None):
+        """Take a token: 0 on success, else seconds until one is available"""
+        now = now or time.monotonic()
+        stripe = hash(key) % self.STRIPES
+        lock, buckets = self.stripes[stripe]
+        with lock:
+            bucket = buckets.get(key)
+            if bucket is None:
+                if len(buckets) >= self.stripe_capacity:
+                    buckets.popitem(last=False)
+                bucket = buckets[key] = [burst, now]
+            else:
+                buckets.move_to_end(key)
+                bucket[0] = min(burst, bucket[0] + (now - bucket[1]) * rate)
+                bucket[1] = now
+            if bucket[0] >= 1:
+                bucket[0] -= 1
+                return 0
+            self.limited[stripe] += 1
+            return (1 - bucket[0]) / rate
+
+    def stats(self):
+        return {
+            "buckets": sum(len(buckets) for _, buckets in self.stripes),
+            "capacity": self.stripe_capacity * self.STRIPES,
+            "limited": sum(self.limited)
+        }
+
+rate_limiter = TokenBuckets(
+    int(os.environ.get('HACKARENA_RATE_LIMIT_BUCKETS', 65536)),
+    os.environ.get('HACKARENA_RATE_LIMIT', '1') != '0'
+)
+
+def rate_limited(rate, burst):
+    """Limit a view's writes to rate/s (bursts of burst) per client IP and per session_id"""
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            if rate_limiter.enabled and request.method != 'GET':
+                data = request.get_json(silent=True)
+                wait = rate_limit_wait(
+                    request.endpoint, rate, burst, data.get("session_id") if isinstance(data, dict) else None
+                )
+                if wait:
+                    response = jsonify({"error": "Too many requests"})
+                    response.headers["Retry-After"] = str(math.ceil(wait))
+                    return response, 429
+            return view(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def rate_limit_wait(endpoint, rate, burst, session_id=None):
+    """Take a token from endpoint's buckets for the client IP and session; 0 or seconds to wait"""
+    keys = [("ip", request.remote_addr)]
+    if session_id:
+        keys.append(("session", str(session_id)))
+    for kind, value in keys:
+        wait = rate_limiter.take((endpoint, kind, value), rate, burst)
+        if wait:
+            return wait
+    return 0
+
+# (rate per second, burst) of the write endpoints, also charged by /api/batch
+LOGIN_RATE = (1, 10)
+GAME_RATE = (2, 20)
+CHAT_RATE = (1, 5)
+
+# ========== HASH INDEX ==========
+class HashIndex:
+    """Read-only digest -> plaintext lookup over memory-mapped index files.
+
+    scripts/build_hash_index.py writes one file per algorithm of sorted,
+    fixed-width records (raw digest followed by a little-endian uint32
+    offset into words.dat, where plaintexts are newline-terminated).
+    Lookups binary-search the mapped pages directly, so every worker shares
+    the OS page cache instead of holding its own copy. Files are opened on
+    first use; without them every lookup misses.
+    """
+    ALGORITHMS = {"md5": 16, "sha1": 20, "sha256": 32}
+    BY_LENGTH = {width * 2: name for name, width in ALGORITHMS.items()}
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.tables = None
+        self.words = None
+        self.lock = threading.Lock()
+
+    def _map(self, name):
+        with open(os.path.join(self.directory, name), 'rb') as f:
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def open(self):
+        with self.lock:
+            if self.tables is not None:
+                return
+            tables = {}
+            try:
+                self.words = self._map("words.dat")
+                for name, width in self.ALGORITHMS.items():
+                    data = self._map(f"{name}.idx")
+                    tables[name] = (data, width, len(data) // (width + 4))
+            except (OSError, ValueError):
+                tables = {}
+            self.tables = tables
+
+    def __len__(self):
+        if self.tables is None:
+            self.open()
+        return sum(count for _, _, count in self.tables.values())
+
+    def _plaintext(self, data, record, width):
+        offset = struct.unpack_from("<I", data, record + width)[0]
+        end = self.words.find(b"\n", offset)
+        return self.words[offset:end].decode()
+
+    def lookup(self, hex_digest):
+        """Plaintext for a hex MD5/SHA-1/SHA-256 digest, or None"""
+        if self.tables is None:
+            self.open()
+        name = self.BY_LENGTH.get(len(hex_digest))
+        if name not in self.tables:
+            return None
+        try:
+            digest = bytes.fromhex(hex_digest)
+        except ValueError:
+            return None
+        
+        data, width, count = self.tables[name]
+        stride = width + 4
+        lo, hi = 0, count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            probe = data[mid * stride:mid * stride + width]
+            if probe < digest:
+                lo = mid + 1
+            elif probe > digest:
+                hi = mid
+            else:
+                return self._plaintext(data, mid * stride, width)
+        return None
+
+    def sample(self, name="md5", rng=random):
+        """A random (hex digest, plaintext) pair, or None without an index"""
+        if self.tables is None:
+            self.open()
+        if name not in self.tables or not self.tables[name][2]:
+            return None
+        data, width, count = self.tables[name]
+        record = rng.randrange(count) * (width + 4)
+        return data[record:record + width].hex(), self._plaintext(data, record, width)
+
+
+hash_index = HashIndex(os.environ.get(
+    'HACKARENA_HASH_INDEX',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data', 'hashindex')
+))
+
+# ========== TERMINAL ==========
+class TerminalCommand:
+    __slots__ = ("name", "usage", "desc", "handler", "arg_choices")
+
+    def __init__(self, name, usage, desc, handler, arg_choices):
+        self.name = name
+        self.usage = usage
+        self.desc = desc
+        self.handler = handler
+        self.arg_choices = arg_choices
+
+
+class Terminal:
+    """Command registry for the terminal simulator, built once at import.
+
+    Execution is a single dict lookup on the command word. Completion walks a
+    prefix trie whose nodes carry the sorted names beneath them, so both
+    cost O(len(input)) plus the size of the answer.
+    """
+
+    def __init__(self):
+        self.commands = {}
+        self.trie = {"names": []}
+
+    def command(self, usage, desc, arg_choices=()):
+        def register(handler):
+            name = usage.split()[0]
+            self.commands[name] = TerminalCommand(name, usage, desc, handler, tuple(sorted(arg_choices)))
+            node = self.trie
+            for char in name:
+                node["names"] = sorted(node["names"] + [name])
+                node = node.setdefault(char, {"names": []})
+            node["names"] = sorted(node["names"] + [name])
+            return handler
+        return register
+
+    def execute(self, line, user=None):
+        """Return (normalized line, output)"""
+        parts = line.split()
+        if not parts:
+            return "", ""
+        name = parts[0].lower()
+        normalized = " ".join([name] + parts[1:])
+        command = self.commands.get(name)
+        if command is None:
+            return normalized, f"Command not found: {normalized}\nType 'help' for available commands."
+        return normalized, command.handler(parts[1:], user)
+
+    def complete(self, line):
+        """Completions for a partially typed line"""
+        name, sep, arg = line.lstrip().partition(" ")
+        if not sep:
+            node = self.trie
+            for char in name.lower():
+                node = node.get(char)
+                if node is None:
+                    return []
+            return list(node["names"])
+        
+        command = self.commands.get(name.lower())
+        if command is None or " " in arg:
+            return []
+        return [f"{command.name} {choice}" for choice in command.arg_choices if choice.startswith(arg)]
+
+    def listing(self):
+        return [{"cmd": c.usage, "desc": c.desc} for c in self.commands.values()]
+
+
+terminal = Terminal()
+
+TERMINAL_FILES = ("flag.txt", "secret.txt", "network.txt", "user.txt", "system.log", "root.txt")
+ENCODED_FILES = {
+    "secret.enc": "Message: 'The encryption key is: HACKARENA_ULTIMATE_2024'"
+}
+HASH_TYPES = {32: ("MD5", hashlib.md5), 40: ("SHA-1", hashlib.sha1), 64: ("SHA-256", hashlib.sha256)}
+TERMINAL_WORDLIST = ("password", "hackarena123", "123456", "admin", "letmein", "qwerty", "root", "toor")
+KNOWN_HASHES = {
+    algorithm(word.encode()).hexdigest(): word
+    for word in TERMINAL_WORDLIST for _, algorithm in HASH_TYPES.values()
+}
+def verify_password(hex_digest, password):
+    """Constant-time check that password hashes to hex_digest"""
+    hash_type = HASH_TYPES.get(len(hex_digest))
+    if hash_type is None:
+        return False
+    return secrets.compare_digest(hash_type[1](password.encode()).hexdigest(), hex_digest.lower())
+
+SCAN_PORTS = (21, 22, 23, 25, 53, 80, 110, 139, 443, 445, 3306, 3389, 5432, 6379, 8080, 8443)
+
+@terminal.command("help", "Show available commands")
+def _help(args, user):
+    if args and args[0] in terminal.commands:
+        command = terminal.commands[args[0]]
+        return f"Usage: {command.usage}\n{command.desc}"
+    return "Available commands: " + ", ".join(name for name in terminal.commands if name != "help")
+
+@terminal.command("ls", "List files")
+def _ls(args, user):
+    return "\n".join(TERMINAL_FILES)
+
+@terminal.command("scan <target>", "Scan network", arg_choices=("10.0.0.0/24",))
+def _scan(args, user):
+    if not args:
+        return "Usage: scan <target>"
+    return _scan_report(args[0])
+
+@functools.lru_cache(maxsize=1024)
+def _scan_report(target):
+    try:
+        network = ipaddress.ip_network(target, strict=False)
+    except ValueError:
+        return f"scan: invalid target '{target}'"
+    
+    target, me, ports = _scan_hosts(network)
+    if me is None:
+        return f"Scanning...\n{target} - Host up (Ports: {ports})"
+    return f"Scanning...\n{network[1]} - Gateway\n{target} - Target Server (Ports: {ports})\n{me} - Your Machine"
+
+def _scan_hosts(network):
+    """(target, your machine or None for a lone host, open ports) found scanning network"""
+    # Deterministic per target, so repeated scans agree with each other
+    rng = random.Random(str(network))
+    ports = ", ".join(str(p) for p in sorted(rng.sample(SCAN_PORTS, rng.randint(2, 5))))
+    if network.num_addresses <= 2:
+        return network[0], None, ports
+    
+    size = network.num_addresses - 1
+    if network == ipaddress.ip_network("10.0.0.0/24"):
+        return network[100], network[150], "22, 80, 443, 8080"
+    return network[rng.randrange(2, size)], network[rng.randrange(2, size)], ports
+
+@terminal.command("crack <hash>", "Crack password hash")
+def _crack(args, user):
+    if not args:
+        return "Usage: crack <hash>"
+    digest = args[0].lower()
+    hash_type = HASH_TYPES.get(len(digest))
+    if hash_type is None or any(c not in "0123456789abcdef" for c in digest):
+        return f"crack: unsupported hash '{args[0]}' (expected MD5, SHA-1 or SHA-256 hex)"
+    
+    start = time.perf_counter()
+    password = hash_index.lookup(digest) or KNOWN_HASHES.get(digest)
+    elapsed = time.perf_counter() - start
+    if password is None:
+        return f"Cracking {hash_type[0]}...\nPassword not found in wordlist"
+    return f"Cracking {hash_type[0]}...\nPassword: {password}\nTime: {elapsed * 1e3:.3f}ms"
+
+@terminal.command("decode <file>", "Decode file", arg_choices=TERMINAL_FILES + tuple(ENCODED_FILES))
+def _decode(args, user):
+    if not args:
+        return "Usage: decode <file>"
+    name = args[0]
+    if name in ENCODED_FILES:
+        return f"Decoding...\n{ENCODED_FILES[name]}"
+    if name in TERMINAL_FILES:
+        return f"Decoding...\nError: {name} is not encoded"
+    return f"decode: {name}: No such file"
+
+@terminal.command("whoami", "Show user info")
+def _whoami(args, user):
+    if user is None:
+        return "User: anonymous\nRank: Ghost\nPoints: 0\nAccess: Level 1"
+    return f"User: {user['username']}\nRank: {user['rank']}\nPoints: {user['points']}\nAccess: Level {user['level']}"
+
+@terminal.command("clear", "Clear terminal")
+def _clear(args, user):
+    return ""
+
+# ========== CHALLENGE POOL ==========
+# Generators return (public challenge data, answer digest or None); the
+# digest stays with the game session and is checked by verify_password().
+def _password_cracker_challenge(seed):
+    sample = hash_index.sample("md5", random.Random(seed))
+    if sample is None:
+        digest = hashlib.md5(b"hackarena123").hexdigest()
+        return {"challenge": {"hash": digest, "hint": "Contains 'hackarena' and numbers"}}, digest
+    digest, password = sample
+    return {"challenge": {
+        "hash": digest,
+        "hint": f"{len(password)} characters, starts with '{password[0]}'"
+    }}, digest
+
+def _answer_digest(answer):
+    return hashlib.sha256(answer.encode()).hexdigest()
+
+def _network_scanner_challenge(seed):
+    network = ipaddress.ip_network(f"10.0.{random.Random(seed).randint(1, 255)}.0/24")
+    target, _, _ = _scan_hosts(network)
+    return {"network": str(network), "hint": "Answer with the target server's address"}, _answer_digest(str(target))
+
+CRYPTO_WORDS = ("firewall", "exploit", "payload", "rootkit", "backdoor", "keylogger", "sandbox", "honeypot")
+
+def _cryptography_challenge(seed):
+    rng = random.Random(seed)
+    word = rng.choice(CRYPTO_WORDS)
+    shift = rng.randint(1, 25)
+    ciphertext = "".join(chr((ord(c) - 97 + shift) % 26 + 97) for c in word)
+    return {"ciphertext": ciphertext, "hint": "Caesar cipher, lowercase letters"}, _answer_digest(word)
+
+def _binary_exploit_challenge(seed):
+    buffer = random.Random(seed).choice((16, 24, 32, 48, 64, 128, 256))
+    return {"binary": {
+        "arch": "x86_64",
+        "buffer": buffer,
+        "hint": "Answer with the input length that reaches the saved return address"
+    }}, _answer_digest(str(buffer + 8))
+
+def _ctf_challenge(seed):
+    flag = f"HACKARENA{{{random.Random(seed).getrandbits(64):016x}}}"
+    data = codecs.encode(base64.b64encode(flag.encode()).decode(), "rot13").encode().hex()
+    return {"data": data, "hint": "Undo hex, then rot13, then base64"}, _answer_digest(flag)
+
+CHALLENGE_GENERATORS = {
+    "password_cracker": _password_cracker_challenge,
+    "network_scanner": _network_scanner_challenge,
+    "cryptography": _cryptography_challenge,
+    "binary_exploit": _binary_exploit_challenge,
+    "ctf": _ctf_challenge
+}
+
+
+class ChallengePool:
+    """Per-game queues of ready-made challenges, refilled in the background.
+
+    take() pops a prepared challenge in O(1) and wakes the refill thread
+    once a queue drops below its low watermark; the thread then tops it back
+    up to full depth. If a queue is empty the challenge is generated inline
+    and counted as starvation. Generators take a seed so they can also run
+    in a process pool (processes > 0) without forked children repeating
+    each other's random streams.
+    """
+    REFILL_INTERVAL = 5
+
+    def __init__(self, generators, depth=32, depths=None, processes=0):
+        self.generators = generators
+        self.depths = {game_id: (depths or {}).get(game_id, depth) for game_id in generators}
+        self.queues = {game_id: deque() for game_id in generators}
+        self.stats = {
+            game_id: {"generated": 0, "served": 0, "starved": 0, "generation_seconds": 0.0, "generation_max": 0.0}
+            for game_id in generators
+        }
+        self.processes = processes
+        self.executor = None
+        self.lock = threading.Lock()
+        self.wakeup = threading.Condition()
+        self.thread = None
+
+    def low_watermark(self, game_id):
+        return max(1, self.depths[game_id] // 4)
+
+    def take(self, game_id):
+        """(challenge data, answer digest); ({}, None) for games without a generator"""
+        if game_id not in self.generators:
+            return {}, None
+        if self.thread is None:
+            self.start()
+        
+        queue_ = self.queues[game_id]
+        try:
+            challenge = queue_.popleft()
+        except IndexError:
+            with self.lock:
+                self.stats[game_id]["starved"] += 1
+            challenge = self.generate(game_id, 1)[0]
+        with self.lock:
+            self.stats[game_id]["served"] += 1
+        
+        if len(queue_) < self.low_watermark(game_id):
+            with self.wakeup:
+                self.wakeup.notify()
+        return challenge
+
+    def generate(self, game_id, count):
+        generator = self.generators[game_id]
+        seeds = [secrets.randbits(64) for _ in range(count)]
+        start = time.perf_counter()
+        if self.executor is None:
+            challenges = [generator(seed) for seed in seeds]
+        else:
+            challenges = list(self.executor.map(generator, seeds))
+        elapsed = time.perf_counter() - start
+        
+        with self.lock:
+            stats = self.stats[game_id]
+            stats["generated"] += count
+            stats["generation_seconds"] += elapsed
+            stats["generation_max"] = max(stats["generation_max"], elapsed / count)
+        return challenges
+
+    def start(self):
+        with self.lock:
+            if self.thread is not None:
+                return
+            if self.processes:
+                # Imported here: multiprocessing adds ~10ms to every cold start
+                from concurrent.futures import ProcessPoolExecutor
+                self.executor = ProcessPoolExecutor(max_workers=self.processes)
+            self.thread = threading.Thread(target=self._refill, name="hackarena-challenges", daemon=True)
+            self.thread.start()
+
+    def _refill(self):
+        while True:
+            for game_id, queue_ in self.queues.items():
+                if len(queue_) < self.low_watermark(game_id):
+                    queue_.extend(self.generate(game_id, self.depths[game_id] - len(queue_)))
+            with self.wakeup:
+                self.wakeup.wait(self.REFILL_INTERVAL)
+
+    def metrics(self):
+        with self.lock:
+            return {
+                game_id: {
+                    **stats,
+                    "ready": len(self.queues[game_id]),
+                    "depth": self.depths[game_id],
+                    "generation_avg": stats["generation_seconds"] / stats["generated"] if stats["generated"] else 0.0
+                }
+                for game_id, stats in self.stats.items()
+            }
+
+
+def _pool_depths(spec):
+    """Parse HACKARENA_CHALLENGE_POOL entries of the form game_id=depth"""
+    depths = {}
+    for item in filter(None, spec.split(",")):
+        game_id, _, depth = item.partition("=")
+        depths[game_id.strip()] = int(depth)
+    return depths
+
+challenge_pool = ChallengePool(
+    CHALLENGE_GENERATORS,
+    depths=_pool_depths(os.environ.get('HACKARENA_CHALLENGE_POOL', '')),
+    processes=int(os.environ.get('HACKARENA_CHALLENGE_PROCESSES', 0))
+)
+
+TERMINAL_PAGE = {
+    "terminal": "active",
+    "welcome": "Welcome to HackArena Terminal v3.0",
+    "commands": terminal.listing()
+}
+
 # ========== API ENDPOINTS ==========
 @app.route('/')
 def index():
     """Main page"""
-    return render_template_string(MAIN_PAGE)
+    return main_page.response(request)
 
 @app.route('/api/health')
 def health():
     """Health check"""
-    return jsonify({
+    return jsonify(health_status())
+
+def health_status():
+    return {
         "status": "online",
         "service": "HackArena",
         "version": "3.0.0",
         "timestamp": datetime.utcnow().isoformat(),
-        "uptime": round(time.time() - app.start_time, 2) if hasattr(app, 'start_time') else 0
-    })
+        "uptime": round(time.time() - app.start_time, 2) if hasattr(app, 'start_time') else 0,
+        "cache": response_cache.stats(),
+        "challenge_pools": challenge_pool.metrics(),
+        "scores": db.scores.stats(),
+        "rate_limit": rate_limiter.stats()
+    }
+
+@app.route('/api/metrics')
+def metrics():
+    """Request metrics in Prometheus text format"""
+    return Response(request_metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/api/debug/profile', methods=['POST'])
+@admin_required
+def debug_profile_start():
+    """Start sampling this worker's stacks in the background; fetch the result with GET"""
+    seconds = request.args.get('seconds', 10, type=float)
+    hz = request.args.get('hz', 100, type=float)
+    if not 0 < seconds or not 0 < hz <= 1000:
+        return jsonify({"error": "Invalid seconds or hz"}), 400
+    
+    if not profiler.start(seconds, 1 / hz):
+        return jsonify({"error": "A profile is already running in this worker"}), 409
+    return jsonify({
+        "status": "running",
+        "seconds": min(seconds, profiler.MAX_SECONDS),
+        "worker": os.getpid()
+    }), 202
+
+@app.route('/api/debug/profile')
+@admin_required
+def debug_profile():
+    """Collapsed-stack text of this worker's last finished profile"""
+    if profiler.busy():
+        return jsonify({"status": "running", "worker": os.getpid()}), 202
+    if profiler.result is None:
+        return jsonify({"error": "No profile in this worker; POST to start one"}), 404
+    
+    stacks, samples = profiler.result
+    response = Response(profiler.collapsed(stacks), mimetype='text/plain')
+    response.headers["X-Profile-Samples"] = str(samples)
+    response.headers["X-Profile-Worker"] = str(os.getpid())
+    return response
 
 @app.route('/api/stats')
 def stats():
     """Get statistics"""
-    return jsonify({
-        "total_players": len(db.users) + 1000,
-        "online_now": len(db.online_users) + 50,
-        "total_games": sum(len(games) for games in db.games.values() if isinstance(games, list)),
-        "total_messages": sum(len(messages) for messages in db.messages.values()),
+    return jsonify(stats_summary())
+
+def stats_summary():
+    counts = db.counts()
+    return {
+        "total_players": counts["users"] + 1000,
+        "online_now": counts["online"] + 50,
+        "total_games": counts["games_completed"],
+        "games_started": counts["games_started"],
+        "points_awarded": counts["points_awarded"],
+        "total_messages": counts["messages"],
+        "messages_by_room": counts["rooms"],
         "uptime": "99.9%",
         "server_load": "optimal"
-    })
+    }
 
 @app.route('/api/leaderboard')
+@cached("leaderboard")
 def leaderboard():
     """Get leaderboard"""
-    limit = request.args.get('limit', 100, type=int)
-    return jsonify(db.leaderboard[:limit])
+    limit = request.args.get('limit', LEADERBOARD_PAGE_SIZE, type=int)
+    offset = request.args.get('offset', 0, type=int)
+    cursor = request.args.get('cursor')
+    
+    try:
+        entries, next_cursor = db.leaderboard_page(offset, limit, cursor)
+    except ValueError:
+        return jsonify({"error": "Invalid cursor"}), 400
+    
+    response = jsonify(entries)
+    if next_cursor is not None:
+        response.headers['X-Next-Cursor'] = next_cursor
+    return response
+
+@app.route('/api/leaderboard/rank/<player>')
+def leaderboard_rank(player):
+    """Get a player's position in the leaderboard by their public player_id"""
+    position = leaderboard_position(player)
+    if position is None:
+        return jsonify({"error": "User not found"}), 404
+    return jsonify(position)
+
+def leaderboard_position(player):
+    ranked = db.leaderboard_rank(player)
+    if ranked is None:
+        return None
+    
+    entry, position, total = ranked
+    return {
+        **entry,
+        "player_id": player,
+        "position": position + 1,
+        "total": total
+    }
 
 @app.route('/api/quick-login', methods=['POST'])
+@rate_limited(*LOGIN_RATE)
 def quick_login():
     """Anonymous login"""
     session_id = secrets.token_hex(16)
     username = f"ghost_{secrets.token_hex(4)}"
     
-    db.users[session_id] = {
+    db.add_user(session_id, {
         "username": username,
         "points": 0,
         "rank": "👤 Ghost",
         "level": 1,
         "created": time.time()
-    }
+    })
     
-    db.online_users.add(username)
+    db.mark_online(username)
     
     return jsonify({
         "status": "success",
         "message": "Logged in anonymously",
         "session_id": session_id,
+        "player_id": player_id(session_id),
         "username": username,
         "points": 0,
         "rank": "👤 Ghost"
     })
 
+@app.route('/api/presence/heartbeat', methods=['POST'])
+def heartbeat():
+    """Keep an anonymous session and its presence alive"""
+    data = request.get_json(silent=True) or {}
+    user = db.heartbeat(data.get("session_id"))
+    if user is None:
+        return jsonify({"error": "Session expired"}), 404
+    
+    return jsonify({
+        "status": "online",
+        "username": user["username"],
+        "expires_in": PRESENCE_TTL
+    })
+
 @app.route('/games')
+@cached("games")
 def games_page():
     """Games page"""
+    return jsonify(games_listing())
+
+def games_listing():
     games_list = []
     for game_id, game_data in db.games.items():
         games_list.append({
@@ -526,156 +3613,431 @@ def games_page():
             **game_data
         })
     
-    return jsonify({
+    return {
         "status": "success",
         "games": games_list,
         "total_games": len(games_list)
-    })
+    }
 
 @app.route('/api/games/<game_id>', methods=['GET', 'POST'])
+@rate_limited(*GAME_RATE)
 def game_handler(game_id):
     """Handle game requests"""
     if game_id not in db.games:
         return jsonify({"error": "Game not found"}), 404
     
     if request.method == 'GET':
-        # Start new game
-        game_session = {
-            "id": secrets.token_hex(8),
-            "game": game_id,
-            "started": time.time(),
-            "completed": False,
-            "score": 0
-        }
-        
-        # Add game-specific data
-        if game_id == "password_cracker":
-            game_session["challenge"] = {
-                "hash": hashlib.md5(b"hackarena123").hexdigest(),
-                "hint": "Contains 'hackarena' and numbers"
-            }
-        elif game_id == "network_scanner":
-            game_session["network"] = f"10.0.{random.randint(1, 255)}.0/24"
-        
-        return jsonify(game_session)
+        return jsonify(start_game_session(game_id, request.args.get("session_id")))
     
     else:  # POST - Submit game results
         data = request.json
-        score = data.get("score", 0)
-        
-        # Update user if logged in
         user_id = data.get("session_id")
-        if user_id in db.users:
-            db.users[user_id]["points"] += score
+        result, status = finish_game_session(game_id, data, user_id)
         
-        return jsonify({
-            "status": "success",
-            "score": score,
-            "message": "Game completed!"
-        })
+        # Update user if logged in
+        if status == 200 and user_id and result["score"]:
+            db.submit_score(user_id, result["score"])
+        return jsonify(result), status
+
+def start_game_session(game_id, owner=None):
+    """Hand out a game session; only owner's session_id can complete it and score"""
+    game_session = {
+        "id": secrets.token_hex(8),
+        "game": game_id,
+        "started": time.time(),
+        "completed": False,
+        "score": 0
+    }
+    
+    # Add game-specific data from the pre-generated pool; the answer stays server-side
+    challenge, answer = challenge_pool.take(game_id)
+    game_session.update(challenge)
+    db.start_game(game_session["id"], game_id, game_session["started"], answer, owner)
+    return game_session
+
+def finish_game_session(game_id, data, user_id):
+    """Check user_id's submission against its game session and consume it; (result, status)"""
+    score = data.get("score", 0)
+    if type(score) is not int or not 0 <= score <= db.games[game_id]["points"]:
+        return {"error": "Invalid score"}, 400
+    
+    # Each session handed out by GET can be completed once, by the player it was issued to
+    game = db.finish_game(data.get("id"), game_id, user_id)
+    if game is None:
+        return {"error": "Game session not found or expired"}, 404
+    
+    result = {"status": "success", "score": score, "message": "Game completed!"}
+    if game["answer"] is not None:
+        # Scores count only with the answer to the challenge this session was issued
+        result["verified"] = verify_password(game["answer"], str(data.get("answer", "")))
+        if not result["verified"]:
+            result["score"] = 0
+            result["message"] = "Wrong answer"
+    return result, 200
 
 @app.route('/terminal')
+@cached()
 def terminal_page():
     """Terminal interface"""
-    return jsonify({
-        "terminal": "active",
-        "welcome": "Welcome to HackArena Terminal v3.0",
-        "commands": [
-            {"cmd": "help", "desc": "Show available commands"},
-            {"cmd": "ls", "desc": "List files"},
-            {"cmd": "scan <target>", "desc": "Scan network"},
-            {"cmd": "crack <hash>", "desc": "Crack password hash"},
-            {"cmd": "decode <file>", "desc": "Decode file"},
-            {"cmd": "whoami", "desc": "Show user info"},
-            {"cmd": "clear", "desc": "Clear terminal"}
-        ]
-    })
+    return jsonify(TERMINAL_PAGE)
 
 @app.route('/api/terminal/execute', methods=['POST'])
 def execute_command():
     """Execute terminal command"""
     data = request.json
-    command = data.get("command", "").strip().lower()
-    
-    responses = {
-        "help": "Available commands: ls, scan, crack, decode, whoami, clear",
-        "ls": "flag.txt\nsecret.txt\nnetwork.txt\nuser.txt\nsystem.log\nroot.txt",
-        "scan 10.0.0.0/24": "Scanning...\n10.0.0.1 - Gateway\n10.0.0.100 - Target Server (Ports: 22, 80, 443, 8080)\n10.0.0.150 - Your Machine",
-        "crack 5f4dcc3b5aa765d61d8327deb882cf99": "Cracking MD5...\nPassword: password\nTime: 2.3s",
-        "decode secret.enc": "Decoding...\nMessage: 'The encryption key is: HACKARENA_ULTIMATE_2024'",
-        "whoami": "User: anonymous\nRank: Ghost\nPoints: 0\nAccess: Level 1",
-        "clear": ""
-    }
-    
-    response = responses.get(command, f"Command not found: {command}\nType 'help' for available commands.")
-    
-    return jsonify({
+    session_id = data.get("session_id")
+    user = db.get_user(session_id) if session_id else None
+    return jsonify(run_terminal(data.get("command", ""), user))
+
+def run_terminal(line, user):
+    command, response = terminal.execute(line, user)
+    return {
         "command": command,
         "output": response,
         "timestamp": time.time()
+    }
+
+@app.route('/api/terminal/complete')
+def complete_command():
+    """Tab-completion for the terminal"""
+    line = request.args.get("line", "")
+    return jsonify({
+        "line": line,
+        "completions": terminal.complete(line)
     })
 
 @app.route('/chat')
+@cached("presence", ttl=CHAT_PAGE_TTL)
 def chat_page():
     """Chat interface"""
+    online, total_online = db.online(20)
     return jsonify({
         "chat": "active",
         "rooms": ["#general", "#hacking", "#ctf", "#help", "#announcements"],
-        "online": list(db.online_users)[:20],
-        "total_online": len(db.online_users)
+        "online": online,
+        "total_online": total_online
     })
 
 @app.route('/api/chat/send', methods=['POST'])
+@rate_limited(*CHAT_RATE)
 def send_message():
     """Send chat message"""
     data = request.json
-    username = data.get("username", f"user_{secrets.token_hex(4)}")
-    message = data.get("message", "")
-    room = data.get("room", "#general")
-    
-    if not message:
+    if not data.get("message", ""):
         return jsonify({"error": "Message cannot be empty"}), 400
+    if not isinstance(data.get("room", "#general"), str):
+        return jsonify({"error": "Room must be a string"}), 400
     
-    msg = {
-        "id": secrets.token_hex(8),
-        "username": username,
-        "message": message,
-        "room": room,
-        "timestamp": datetime.utcnow().isoformat(),
-        "encrypted": data.get("encrypted", False)
-    }
-    
-    db.messages[room].append(msg)
-    if len(db.messages[room]) > 100:
-        db.messages[room] = db.messages[room][-100:]
+    msg = new_message(data)
+    seq = db.post_message(msg["room"], msg, tokenize(msg["message"]))
     
     return jsonify({
         "status": "sent",
-        "message_id": msg["id"]
+        "message_id": msg["id"],
+        "seq": seq
     })
 
+def new_message(data):
+    return {
+        "id": secrets.token_hex(8),
+        "username": data.get("username", f"user_{secrets.token_hex(4)}"),
+        "message": data.get("message", ""),
+        "room": data.get("room", "#general"),
+        "timestamp": datetime.utcnow().isoformat(),
+        "encrypted": data.get("encrypted", False)
+    }
+
 @app.route('/api/chat/messages')
 def get_messages():
-    """Get chat messages"""
+    """Get chat messages; before=<seq> scrolls back through archived history"""
     room = request.args.get("room", "#general")
-    limit = int(request.args.get("limit", 50))
+    limit = max(0, request.args.get("limit", 50, type=int))
+    since = request.args.get("since", type=int)
+    before = request.args.get("before", type=int)
+    wait = min(max(0, request.args.get("wait", 0, type=float)), LONG_POLL_MAX_WAIT)
     
-    messages = db.messages.get(room, [])[-limit:]
+    if wait and since is not None and before is None:
+        # Long-poll: hold the request until send_message wakes the room
+        db.wait_messages(room, since, wait)
     
-    return jsonify({
+    return jsonify(room_messages(room, since, limit, before))
+
+def room_messages(room, since, limit, before=None):
+    if before is not None:
+        messages, last_seq = db.read_messages_before(room, before, min(limit, CHAT_SCROLLBACK_MAX))
+    else:
+        # Newer reads keep to the ring's window on every backend; only
+        # before= scrolls back into archived history
+        messages, last_seq = db.read_messages(room, since, min(limit, ChatRoom.CAPACITY))
+    return {
         "room": room,
         "messages": messages,
-        "count": len(messages)
+        "count": len(messages),
+        "last_seq": last_seq
+    }
+
+@app.route('/api/chat/search')
+def search_messages():
+    """Search retained chat history for messages containing every term of q"""
+    query = request.args.get("q", "")
+    room = request.args.get("room")
+    user = request.args.get("user")
+    limit = min(max(0, request.args.get("limit", 20, type=int)), CHAT_SEARCH_MAX_RESULTS)
+    
+    terms = tokenize(query)
+    if not terms and not user:
+        return jsonify({"error": "Search needs a query or a user"}), 400
+    return jsonify(search_results(query, terms, user, room, limit))
+
+def search_results(query, terms, user, room, limit):
+    results = db.search_messages(terms, user, room, limit)
+    return {
+        "query": query,
+        "terms": list(terms),
+        "room": room,
+        "user": user,
+        "results": results,
+        "count": len(results)
+    }
+
+@app.route('/api/chat/stream')
+def stream_messages():
+    """Stream chat messages as Server-Sent Events"""
+    room = request.args.get("room", "#general")
+    since = request.headers.get("Last-Event-ID", type=int)
+    if since is None:
+        since = request.args.get("since", type=int)
+    if since is None:
+        since = db.read_messages(room, None, 0)[1]
+    
+    def events(seq):
+        yield "retry: 3000\n\n"
+        while True:
+            if not db.wait_messages(room, seq, SSE_KEEPALIVE):
+                yield ": keepalive\n\n"
+                continue
+            for msg in db.read_messages(room, seq, ChatRoom.CAPACITY)[0]:
+                seq = msg["seq"]
+                yield f"id: {seq}\nevent: message\ndata: {msg.raw.decode()}\n\n"
+    
+    return Response(stream_with_context(events(since)), mimetype='text/event-stream', headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no"
     })
 
 @app.route('/leaderboard')
+@cached("leaderboard")
 def leaderboard_page():
     """Leaderboard page"""
     return jsonify({
-        "leaderboard": db.leaderboard,
+        "leaderboard": db.leaderboard_top(LEADERBOARD_PAGE_SIZE),
         "updated": time.time()
     })
 
+# ========== BATCH API ==========
+class BatchRunner:
+    """Runs the sub-operations of one /api/batch request, in order.
+
+    Reads are handled one by one as handler(args, session_id). Writes of one
+    kind that follow each other are handed to their handler as a single run,
+    so it touches each partition once: chat sends are posted per room under
+    one acquisition of the room lock, game scores merge into one aggregator
+    batch and terminal commands share one user lookup. Handlers return a
+    body or (body, status), like views; one failing operation does not
+    abort the others.
+    """
+    MAX_OPS = int(os.environ.get('HACKARENA_BATCH_MAX_OPS', 50))
+
+    def __init__(self):
+        self.handlers = {}
+        self.grouped = set()
+
+    def op(self, name, grouped=False):
+        def register(handler):
+            self.handlers[name] = handler
+            if grouped:
+                self.grouped.add(name)
+            return handler
+        return register
+
+    @staticmethod
+    def _name(op):
+        name = op.get("op") if isinstance(op, dict) else None
+        return name if isinstance(name, str) else None
+
+    def run(self, ops, session_id=None):
+        results = []
+        start = 0
+        while start < len(ops):
+            name = self._name(ops[start])
+            handler = self.handlers.get(name)
+            end = start + 1
+            if handler is None:
+                outcomes = [({"error": "Unknown operation"}, 400)]
+            else:
+                if name in self.grouped:
+                    while end < len(ops) and self._name(ops[end]) == name:
+                        end += 1
+                args = [MultiDict(op) for op in ops[start:end]]
+                try:
+                    if name in self.grouped:
+                        outcomes = handler(args, session_id)
+                    else:
+                        outcomes = [handler(args[0], session_id)]
+                except Exception as e:
+                    outcomes = [({"error": "unexpected_error", "message": str(e), "type": type(e).__name__}, 500)]
+                    outcomes *= end - start
+            for outcome in outcomes:
+                body, status = outcome if isinstance(outcome, tuple) else (outcome, 200)
+                results.append({"op": name, "status": status, "body": body})
+            start = end
+        return results
+
+
+batch = BatchRunner()
+
+def _over_rate_limit(endpoint, limit, session_id):
+    """The 429 outcome of a batched write over its endpoint's rate limit, or None"""
+    if not rate_limiter.enabled:
+        return None
+    wait = rate_limit_wait(endpoint, *limit, session_id)
+    if wait:
+        return {"error": "Too many requests", "retry_after": math.ceil(wait)}, 429
+    return None
+
+@batch.op("health")
+def _batch_health(args, session_id):
+    return health_status()
+
+@batch.op("stats")
+def _batch_stats(args, session_id):
+    return stats_summary()
+
+@batch.op("leaderboard")
+def _batch_leaderboard(args, session_id):
+    try:
+        entries, next_cursor = db.leaderboard_page(
+            args.get("offset", 0, type=int), args.get("limit", LEADERBOARD_PAGE_SIZE, type=int), args.get("cursor")
+        )
+    except ValueError:
+        return {"error": "Invalid cursor"}, 400
+    return {"entries": entries, "next_cursor": next_cursor}
+
+@batch.op("leaderboard.rank")
+def _batch_leaderboard_rank(args, session_id):
+    # Without a player_id, look up the caller's own session
+    player = args.get("player_id")
+    if player is None and session_id is not None:
+        player = player_id(session_id)
+    position = leaderboard_position(player) if player is not None else None
+    if position is None:
+        return {"error": "User not found"}, 404
+    return position
+
+@batch.op("games")
+def _batch_games(args, session_id):
+    return games_listing()
+
+@batch.op("games.start")
+def _batch_game_start(args, session_id):
+    if args.get("game") not in db.games:
+        return {"error": "Game not found"}, 404
+    return start_game_session(args["game"], args.get("session_id", session_id))
+
+@batch.op("games.submit", grouped=True)
+def _batch_game_submit(ops, session_id):
+    outcomes = []
+    deltas = {}
+    for args in ops:
+        user_id = args.get("session_id", session_id)
+        game_id = args.get("game")
+        limited = _over_rate_limit("game_handler", GAME_RATE, user_id)
+        if limited is not None:
+            outcomes.append(limited)
+            continue
+        if game_id not in db.games:
+            outcomes.append(({"error": "Game not found"}, 404))
+            continue
+        result, status = finish_game_session(game_id, args, user_id)
+        if status == 200 and user_id and result["score"]:
+            deltas[user_id] = deltas.get(user_id, 0) + result["score"]
+        outcomes.append((result, status))
+    
+    if deltas:
+        db.submit_scores(deltas)
+    return outcomes
+
+@batch.op("chat.messages")
+def _batch_chat_messages(args, session_id):
+    # Never long-polls: wait is ignored inside a batch
+    return room_messages(
+        args.get("room", "#general"), args.get("since", type=int), max(0, args.get("limit", 50, type=int)),
+        args.get("before", type=int)
+    )
+
+@batch.op("chat.send", grouped=True)
+def _batch_chat_send(ops, session_id):
+    outcomes = [None] * len(ops)
+    rooms = {}
+    for i, args in enumerate(ops):
+        limited = _over_rate_limit("send_message", CHAT_RATE, args.get("session_id", session_id))
+        if limited is not None:
+            outcomes[i] = limited
+        elif not args.get("message", ""):
+            outcomes[i] = {"error": "Message cannot be empty"}, 400
+        elif not isinstance(args.get("room", "#general"), str):
+            outcomes[i] = {"error": "Room must be a string"}, 400
+        else:
+            msg = new_message(args)
+            rooms.setdefault(msg["room"], []).append((i, msg))
+    
+    for room, posts in rooms.items():
+        seqs = db.post_messages(room, [msg for _, msg in posts], [tokenize(msg["message"]) for _, msg in posts])
+        for (i, msg), seq in zip(posts, seqs):
+            outcomes[i] = {"status": "sent", "message_id": msg["id"], "seq": seq}
+    return outcomes
+
+@batch.op("chat.search")
+def _batch_chat_search(args, session_id):
+    query = args.get("q", "")
+    terms = tokenize(query)
+    if not terms and not args.get("user"):
+        return {"error": "Search needs a query or a user"}, 400
+    limit = min(max(0, args.get("limit", 20, type=int)), CHAT_SEARCH_MAX_RESULTS)
+    return search_results(query, terms, args.get("user"), args.get("room"), limit)
+
+@batch.op("terminal.execute", grouped=True)
+def _batch_terminal_execute(ops, session_id):
+    users = {}
+    outcomes = []
+    for args in ops:
+        user_id = args.get("session_id", session_id)
+        if user_id not in users:
+            users[user_id] = db.get_user(user_id) if user_id else None
+        outcomes.append(run_terminal(args.get("command", ""), users[user_id]))
+    return outcomes
+
+@batch.op("terminal.complete")
+def _batch_terminal_complete(args, session_id):
+    line = args.get("line", "")
+    return {"line": line, "completions": terminal.complete(line)}
+
+@app.route('/api/batch', methods=['POST'])
+def run_batch():
+    """Run several API operations in one request"""
+    data = request.get_json(silent=True)
+    ops = data.get("ops") if isinstance(data, dict) else None
+    if not isinstance(ops, list):
+        return jsonify({"error": "Expected a JSON object with an ops list"}), 400
+    if len(ops) > batch.MAX_OPS:
+        return jsonify({"error": f"A batch holds at most {batch.MAX_OPS} operations"}), 400
+    
+    results = batch.run(ops, data.get("session_id"))
+    return jsonify({
+        "results": results,
+        "count": len(results)
+    })
+
 # ========== ERROR HANDLERS ==========
 @app.errorhandler(404)
 def not_found(e):
@@ -702,11 +4064,13 @@ def handle_exception(e):
     }), 500
 
 # ========== INITIALIZATION ==========
-@app.before_first_request
 def initialize():
     app.start_time = time.time()
     print(f"HackArena started at {datetime.utcnow().isoformat()}")
 
+# Runs at import, so the first request doesn't pay for it
+initialize()
+
 # Vercel requires this
 if __name__ == '__main__':
     app.run(debug=True, host='0.0.0.0', port=8080)
@@ -0,0 +1,144 @@
+"""Idle chat listeners under the ASGI server: memory per connection and fan-out.
+
+Spawns uvicorn serving api/asgi.py, opens --listeners Server-Sent Events
+streams on one room in batches, and samples the server's RSS from /proc as
+they connect and while they sit idle (receiving only keepalives). Then
+posts one message and times its delivery to every listener.
+
+Needs uvicorn: pip install -r requirements-asgi.txt
+Usage: python benchmarks/asgi_idle_listeners.py [--listeners 10000] [--batch 500] [--idle 30]
+"""
+import argparse
+import asyncio
+import os
+import resource
+import socket
+import statistics
+import subprocess
+import sys
+import time
+
+API_DIR = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'api'))
+ROOM = "%23bench"
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def rss_kb(pid):
+    with open(f"/proc/{pid}/status") as f:
+        return next(int(line.split()[1]) for line in f if line.startswith("VmRSS:"))
+
+
+def cpu_seconds(pid):
+    with open(f"/proc/{pid}/stat") as f:
+        fields = f.read().rsplit(")", 1)[1].split()
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+
+def spawn_uvicorn(port):
+    env = dict(os.environ, HACKARENA_RATE_LIMIT="0")
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "asgi:application", "--app-dir", API_DIR,
+         "--port", str(port), "--log-level", "warning", "--backlog", "4096"],
+        env=env
+    )
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        if server.poll() is not None:
+            raise SystemExit(f"uvicorn exited with status {server.returncode}")
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return server
+        except OSError:
+            time.sleep(0.2)
+    server.terminate()
+    raise SystemExit("uvicorn did not become ready within 30s")
+
+
+async def listen(port):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(f"GET /api/chat/stream?room={ROOM} HTTP/1.1\r\nHost: bench\r\n\r\n".encode())
+    await reader.readuntil(b"retry: 3000")
+    return reader, writer
+
+
+async def post(port):
+    body = b'{"room": "#bench", "message": "fan-out", "username": "bench"}'
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(
+        b"POST /api/chat/send HTTP/1.1\r\nHost: bench\r\nContent-Type: application/json\r\n"
+        b"Connection: close\r\nContent-Length: " + str(len(body)).encode() + b"\r\n\r\n" + body
+    )
+    status = (await reader.readline()).split()[1]
+    writer.close()
+    return int(status)
+
+
+async def run(args, port, pid):
+    baseline = rss_kb(pid)
+    print(f"{'listeners':>10}{'server RSS MB':>15}{'KB/listener':>13}")
+    print(f"{0:>10}{baseline / 1024:>15.1f}{'':>13}")
+
+    connections = []
+    while len(connections) < args.listeners:
+        count = min(args.batch, args.listeners - len(connections))
+        connections += await asyncio.gather(*(listen(port) for _ in range(count)))
+        rss = rss_kb(pid)
+        print(f"{len(connections):>10}{rss / 1024:>15.1f}{(rss - baseline) / len(connections):>13.2f}")
+
+    cpu_before = cpu_seconds(pid)
+    samples = []
+    started = time.perf_counter()
+    while time.perf_counter() - started < args.idle:
+        await asyncio.sleep(min(5, args.idle))
+        samples.append(rss_kb(pid))
+    idle_cpu = (cpu_seconds(pid) - cpu_before) / (time.perf_counter() - started)
+    print(f"idle {args.idle:.0f}s: RSS max {max(samples) / 1024:.1f} MB, "
+          f"{(max(samples) - baseline) / len(connections):.2f} KB/listener, server CPU {idle_cpu:.1%}")
+
+    async def delivered(reader):
+        await reader.readuntil(b"event: message")
+        return time.perf_counter()
+
+    waiting = [asyncio.ensure_future(delivered(reader)) for reader, _ in connections]
+    await asyncio.sleep(0.1)
+    sent = time.perf_counter()
+    status = await post(port)
+    latencies = sorted((arrived - sent) * 1e3 for arrived in await asyncio.gather(*waiting))
+    print(f"fan-out to {len(latencies)} listeners (post status {status}): "
+          f"p50 {statistics.median(latencies):.1f} ms, p99 {latencies[int(len(latencies) * 0.99) - 1]:.1f} ms, "
+          f"all {latencies[-1]:.1f} ms")
+
+    for _, writer in connections:
+        writer.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--listeners', type=int, default=10000)
+    parser.add_argument('--batch', type=int, default=500, help="connections opened concurrently")
+    parser.add_argument('--idle', type=float, default=30, help="seconds to hold the listeners idle")
+    args = parser.parse_args()
+
+    # Client and server each hold one descriptor per listener
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < args.listeners + 256 <= hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    elif soft < args.listeners + 256:
+        raise SystemExit(f"open file limit {hard} is too low for {args.listeners} listeners")
+
+    port = free_port()
+    server = spawn_uvicorn(port)
+    try:
+        asyncio.run(run(args, port, server.pid))
+    finally:
+        server.terminate()
+        server.wait()
+
+
+if __name__ == '__main__':
+    main()
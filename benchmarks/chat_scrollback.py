@@ -0,0 +1,105 @@
+"""Tiered chat history: memory per room and scrollback latency.
+
+Posts --history messages to each of --rooms rooms through MemoryStore, once
+with rings as large as the history ("unbounded", all in memory) and once
+with the default ring spilling to a ChatArchive in a temporary directory
+("tiered"). Each layout runs in a fresh interpreter, reporting RSS growth
+per room, archive bytes on disk per message, and the time to read a page
+of --page messages with before=<seq> at several depths of the history.
+
+Usage: python benchmarks/chat_scrollback.py [--rooms 20] [--history 50000] [--page 50]
+"""
+import argparse
+import gc
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+API_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'api')
+
+LAYOUTS = ("unbounded", "tiered")
+DEPTHS = (0.01, 0.5, 0.99)
+
+
+def rss_kb():
+    with open("/proc/self/status") as f:
+        return next(int(line.split()[1]) for line in f if line.startswith("VmRSS:"))
+
+
+def disk_bytes(directory):
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(directory) for name in names)
+
+
+def measure(layout, rooms, history, page):
+    """(bytes of RSS per room, archive bytes per message, [page read us at each depth])"""
+    sys.path.insert(0, API_DIR)
+    import index
+
+    archive_dir = tempfile.mkdtemp(prefix="chat-scrollback-") if layout == "tiered" else None
+    try:
+        store = index.MemoryStore(chat_archive=archive_dir)
+        names = [f"#room{i}" for i in range(rooms)]
+        if layout == "unbounded":
+            for name in names:
+                store.messages[name] = index.ChatRoom(history)
+        rng = random.Random(1)
+        gc.collect()
+        before = rss_kb()
+
+        for i in range(history):
+            for name in names:
+                words = " ".join(f"word{rng.randrange(2000)}" for _ in range(rng.randint(3, 12)))
+                store.post_message(name, {
+                    "id": f"{i:016x}", "username": f"user{rng.randrange(50)}", "message": words,
+                    "room": name, "timestamp": f"2026-01-01T00:00:{i % 60:02d}", "encrypted": False
+                })
+
+        gc.collect()
+        per_room = (rss_kb() - before) * 1024 / rooms
+        on_disk = disk_bytes(archive_dir) / (rooms * history) if archive_dir else 0
+        timings = []
+        for depth in DEPTHS:
+            seq = max(page + 1, int(history * (1 - depth)))
+            started = time.perf_counter()
+            for name in names:
+                messages, _ = store.read_messages_before(name, seq, page)
+                assert [msg["seq"] for msg in messages] == list(range(seq - page, seq))
+            timings.append((time.perf_counter() - started) / rooms * 1e6)
+        return per_room, on_disk, timings
+    finally:
+        if archive_dir:
+            shutil.rmtree(archive_dir, True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rooms', type=int, default=20)
+    parser.add_argument('--history', type=int, default=50000, help="messages posted to each room")
+    parser.add_argument('--page', type=int, default=50)
+    parser.add_argument('--layouts', default=",".join(LAYOUTS))
+    parser.add_argument('--child', choices=LAYOUTS, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        per_room, on_disk, timings = measure(args.child, args.rooms, args.history, args.page)
+        print(per_room, on_disk, *timings)
+        return
+
+    depths = "".join(f"{f'page us @{depth:.0%}':>16}" for depth in DEPTHS)
+    print(f"{'layout':<11}{'KB/room':>10}{'disk B/msg':>12}{depths}")
+    for layout in args.layouts.split(","):
+        child = subprocess.run(
+            [sys.executable, __file__, "--child", layout, "--rooms", str(args.rooms),
+             "--history", str(args.history), "--page", str(args.page)],
+            capture_output=True, text=True, check=True
+        )
+        per_room, on_disk, *timings = map(float, child.stdout.split()[-2 - len(DEPTHS):])
+        print(f"{layout:<11}{per_room / 1024:>10.0f}{on_disk:>12.1f}" + "".join(f"{t:>16.1f}" for t in timings))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+"""Chat search through the inverted index vs a linear scan of the room.
+
+Fills a ChatRoom of --history messages drawn from a Zipf-like vocabulary,
+then times multi-term AND queries (with and without a user filter) through
+ChatRoom.search and through a scan that tokenizes every retained message.
+Also reports the size of the postings arrays.
+
+Usage: python benchmarks/chat_search.py [--history 10000] [--queries 200]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'api'))
+
+from index import ChatIndex, ChatRoom, tokenize
+
+VOCABULARY = [f"word{i}" for i in range(2000)]
+USERS = [f"user{i}" for i in range(50)]
+
+
+def fill(room, count, rng):
+    weights = [1 / (rank + 1) for rank in range(len(VOCABULARY))]
+    for i in range(count):
+        words = rng.choices(VOCABULARY, weights, k=rng.randint(3, 12))
+        room.append({"id": str(i), "username": rng.choice(USERS), "message": " ".join(words), "timestamp": str(i)})
+
+
+def scan(room, terms, user, limit):
+    found = []
+    for msg in reversed(room.tail(room.capacity)):
+        if user is not None and msg["username"] != user:
+            continue
+        if set(terms) <= set(tokenize(msg["message"])):
+            found.append(msg)
+            if len(found) == limit:
+                break
+    return found
+
+
+def timed(fn, queries):
+    started = time.perf_counter()
+    hits = sum(len(fn(terms, user)) for terms, user in queries)
+    return (time.perf_counter() - started) / len(queries) * 1e6, hits
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--history', type=int, default=10000, help="messages retained in the room")
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--limit', type=int, default=20)
+    args = parser.parse_args()
+
+    rng = random.Random(1)
+    room = ChatRoom(args.history)
+    fill(room, args.history * 2, rng)
+
+    entries = sum(len(postings) for postings in room.index.postings.values())
+    array_bytes = sum(postings.deltas.buffer_info()[1] * postings.deltas.itemsize
+                      for postings in room.index.postings.values())
+    print(f"{len(room)} messages, {len(room.index.postings)} keys, {entries} postings, "
+          f"{array_bytes / 1024:.0f} KB of postings arrays")
+
+    print(f"{'query':<24}{'index us':>10}{'scan us':>10}{'hits':>7}")
+    for label, terms_per_query, with_user in (("1 term", 1, False), ("2 terms", 2, False),
+                                              ("3 terms", 3, False), ("2 terms + user", 2, True)):
+        queries = [(tuple(rng.sample(VOCABULARY[:200], terms_per_query)), rng.choice(USERS) if with_user else None)
+                   for _ in range(args.queries)]
+        indexed, hits = timed(lambda terms, user: room.search(ChatIndex.keys(terms, user), args.limit), queries)
+        scanned, scan_hits = timed(lambda terms, user: scan(room, terms, user, args.limit), queries)
+        assert hits == scan_hits, (label, hits, scan_hits)
+        print(f"{label:<24}{indexed:>10.1f}{scanned:>10.1f}{hits / len(queries):>7.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+"""Cold-start budget report: import time and first-request latency of the app.
+
+Starts fresh interpreters with -X importtime, each importing api/index.py
+and serving its first landing-page and API requests through the test
+client. Reports medians over --runs processes, the modules with the
+largest self import time, and exits 1 when the median import of index
+exceeds --budget-ms. Pass --snapshot to measure with a startup snapshot
+from scripts/build_startup_snapshot.py (default: none).
+
+Usage: python benchmarks/cold_start.py [--runs 5] [--budget-ms 400] [--snapshot data/startup.json]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+API_DIR = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'api'))
+
+CHILD = f'''
+import json, sys, time
+started = time.perf_counter()
+sys.path.insert(0, {API_DIR!r})
+import index
+imported = time.perf_counter()
+client = index.app.test_client()
+client.get('/', headers={{"Accept-Encoding": "br, gzip"}})
+landing = time.perf_counter()
+client.get('/api/leaderboard')
+api = time.perf_counter()
+print(json.dumps({{
+    "import_ms": (imported - started) * 1e3,
+    "first_page_ms": (landing - imported) * 1e3,
+    "first_api_ms": (api - landing) * 1e3
+}}))
+'''
+
+
+def parse_importtime(stderr):
+    """{module: (self_us, cumulative_us)} from -X importtime output"""
+    modules = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        modules[name.strip()] = (int(self_us), int(cumulative_us))
+    return modules
+
+
+def run_once(env):
+    started = time.perf_counter()
+    child = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", CHILD], env=env, capture_output=True, text=True, check=True
+    )
+    wall_ms = (time.perf_counter() - started) * 1e3
+    timings = json.loads(child.stdout.strip().splitlines()[-1])
+    timings["process_ms"] = wall_ms
+    return timings, parse_importtime(child.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--budget-ms', type=float, default=400, help="allowed median import time of index")
+    parser.add_argument('--snapshot', default=os.devnull, help="startup snapshot to load (default: none)")
+    parser.add_argument('--top', type=int, default=12, help="modules to list by self import time")
+    args = parser.parse_args()
+
+    env = dict(os.environ, HACKARENA_STARTUP_SNAPSHOT=args.snapshot)
+    runs = [run_once(env) for _ in range(args.runs)]
+
+    print(f"{'metric':<22}{'median ms':>12}{'max ms':>10}")
+    for metric in ("import_ms", "first_page_ms", "first_api_ms", "process_ms"):
+        values = [timings[metric] for timings, _ in runs]
+        print(f"{metric:<22}{statistics.median(values):>12.1f}{max(values):>10.1f}")
+
+    names = set().union(*(modules for _, modules in runs))
+    self_ms = {
+        name: statistics.median(modules.get(name, (0, 0))[0] for _, modules in runs) / 1e3 for name in names
+    }
+    print(f"\n{'module':<40}{'self ms':>10}{'cumulative ms':>15}")
+    for name in sorted(self_ms, key=self_ms.get, reverse=True)[:args.top]:
+        cumulative = statistics.median(modules.get(name, (0, 0))[1] for _, modules in runs) / 1e3
+        print(f"{name:<40}{self_ms[name]:>10.1f}{cumulative:>15.1f}")
+
+    median_import = statistics.median(timings["import_ms"] for timings, _ in runs)
+    if median_import > args.budget_ms:
+        print(f"\nOVER BUDGET: import {median_import:.1f} ms > {args.budget_ms:.0f} ms")
+        sys.exit(1)
+    print(f"\nOK: import {median_import:.1f} ms within {args.budget_ms:.0f} ms budget")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,53 @@
+"""Journal write throughput: group-commit fsync vs fsync-per-write.
+
+Usage: python benchmarks/journal_throughput.py [--threads 16] [--records 200]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'api'))
+
+from index import Journal
+
+
+def run(max_batch, threads, records):
+    record = {"op": "points", "id": "f" * 32, "points": 1337}
+    with tempfile.TemporaryDirectory() as directory:
+        journal = Journal(directory, max_batch=max_batch)
+        
+        def writer():
+            for _ in range(records):
+                journal.append(record)
+        
+        workers = [threading.Thread(target=writer) for _ in range(threads)]
+        start = time.perf_counter()
+        for t in workers:
+            t.start()
+        for t in workers:
+            t.join()
+        elapsed = time.perf_counter() - start
+        journal.close()
+    return threads * records / elapsed, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--records', type=int, default=200, help="records per thread")
+    args = parser.parse_args()
+    
+    print(f"{args.threads} threads x {args.records} records, fsync on every commit")
+    print(f"{'mode':<24}{'writes/s':>12}{'seconds':>10}")
+    baseline = None
+    for name, max_batch in (("fsync-per-write", 1), ("group commit", Journal.MAX_BATCH)):
+        rate, elapsed = run(max_batch, args.threads, args.records)
+        baseline = baseline or rate
+        print(f"{name:<24}{rate:>12.0f}{elapsed:>10.2f}   x{rate / baseline:.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+"""JSON encoding microbenchmark for /api/leaderboard?limit=100 and /api/chat/messages.
+
+"before" serves the routes through Flask's stdlib DefaultJSONProvider,
+re-encoding every row. "after" uses FastJSONProvider, which splices the
+pre-encoded leaderboard and chat fragments, with and without orjson.
+The response cache is cleared before every request so each one
+serializes.
+
+Usage: python benchmarks/json_encoding.py [--requests 2000]
+"""
+import argparse
+import os
+import secrets
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'api'))
+
+from flask.json.provider import DefaultJSONProvider
+
+import index
+from index import app, db, response_cache, FastJSONProvider, JSONFragment
+
+
+class StdlibProvider(DefaultJSONProvider):
+    """Flask's default provider, unwrapping fragments the way plain dicts would be encoded"""
+
+    @staticmethod
+    def default(o):
+        if isinstance(o, JSONFragment):
+            return o.value
+        return DefaultJSONProvider.default(o)
+
+
+def populate(players, messages):
+    for i in range(players):
+        user_id = secrets.token_hex(16)
+        db.add_user(user_id, {
+            "username": f"ghost_{i:05d}", "points": 0, "rank": "👤 Ghost", "level": 1, "created": time.time()
+        })
+        db.add_points(user_id, (i * 7919) % 5000)
+    for i in range(messages):
+        db.post_message("#general", {
+            "id": secrets.token_hex(8), "username": f"ghost_{i:05d}", "message": f"message number {i}",
+            "room": "#general", "timestamp": "2024-01-01T00:00:00", "encrypted": False
+        })
+
+
+def measure(client, url, requests):
+    start = time.perf_counter()
+    for _ in range(requests):
+        response_cache.entries.clear()
+        client.get(url)
+    return (time.perf_counter() - start) / requests
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=2000)
+    args = parser.parse_args()
+    
+    populate(players=1000, messages=100)
+    client = app.test_client()
+    urls = ['/api/leaderboard?limit=100', '/api/chat/messages']
+    orjson = index.orjson
+    modes = [
+        ("before (stdlib, per-row)", StdlibProvider(app), None),
+        ("after (stdlib, fragments)", FastJSONProvider(app), None),
+    ]
+    if orjson is not None:
+        modes.append(("after (orjson, fragments)", FastJSONProvider(app), orjson))
+    
+    print(f"{'mode':<28}" + "".join(f"{url:>30}" for url in urls))
+    for name, provider, encoder in modes:
+        app.json = provider
+        index.orjson = encoder
+        timings = [measure(client, url, args.requests) for url in urls]
+        print(f"{name:<28}" + "".join(f"{t * 1e6:>27.1f} us" for t in timings))
+    index.orjson = orjson
+
+
+if __name__ == '__main__':
+    main()
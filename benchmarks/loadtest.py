@@ -0,0 +1,407 @@
+"""Scenario load test for the HackArena API, in-process or against gunicorn.
+
+Runs realistic traffic mixes for a fixed duration each and reports p50/p95/
+p99 latency, requests per second and server RSS per scenario:
+
+  login       login storm: quick-login followed by a presence heartbeat
+  chat        chat flood: senders posting while a quarter of the threads poll
+  tournament  score submissions concentrated on a handful of top players
+  landing     landing-page traffic: /, /api/stats, leaderboard, game list
+  bootstrap   landing-page data (stats, leaderboard, health, chat) as one /api/batch
+  terminal    a scripted terminal session as one /api/batch
+
+--target inprocess drives the Flask app through its test client in this
+process; --target gunicorn spawns gunicorn on a local port (sharing state
+through SQLite when it runs more than one worker) and talks HTTP to it.
+All load comes from one address, so rate limiting is switched off unless
+--rate-limit is given.
+Results can be saved as JSON and compared against a stored baseline; any
+scenario whose throughput drops or whose p95 rises by more than the
+threshold is reported as a regression and the exit status is 1.
+
+Usage:
+  python benchmarks/loadtest.py [--target inprocess|gunicorn] [--duration 10]
+      [--concurrency 16] [--scenarios login,chat,tournament,landing,bootstrap,terminal]
+      [--rate-limit] [--output results.json] [--baseline baseline.json]
+      [--threshold 0.15]
+"""
+import argparse
+import base64
+import codecs
+import http.client
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+API_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'api')
+sys.path.insert(0, API_DIR)
+
+TOP_PLAYERS = 5
+ROOMS = ["#loadtest-a", "#loadtest-b"]
+
+
+# ----- clients -----
+class InProcessClient:
+    """Flask test client; one per thread"""
+    
+    def __init__(self):
+        from index import app
+        self.client = app.test_client()
+    
+    def request(self, method, path, body=None, headers=None):
+        response = self.client.open(path, method=method, json=body, headers=headers)
+        return response.status_code, response.get_data()
+
+
+class HTTPClient:
+    """Keep-alive HTTP/1.1 connection to a running server; one per thread"""
+    
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.conn = None
+    
+    def request(self, method, path, body=None, headers=None):
+        headers = dict(headers or {})
+        payload = None
+        if body is not None:
+            payload = json.dumps(body).encode()
+            headers["Content-Type"] = "application/json"
+        for attempt in (0, 1):
+            if self.conn is None:
+                self.conn = http.client.HTTPConnection(self.host, self.port, timeout=30)
+            try:
+                self.conn.request(method, path, body=payload, headers=headers)
+                response = self.conn.getresponse()
+                return response.status, response.read()
+            except (http.client.HTTPException, OSError):
+                # The server may close an idle keep-alive connection; retry once on a fresh one
+                self.conn.close()
+                self.conn = None
+                if attempt:
+                    raise
+
+
+class Session:
+    """Per-thread client wrapper that times every call by operation name"""
+    
+    def __init__(self, client):
+        self.client = client
+        self.latencies = {}
+        self.errors = 0
+        self.rng = random.Random()
+    
+    def call(self, op, method, path, body=None, headers=None):
+        start = time.perf_counter()
+        try:
+            status, data = self.client.request(method, path, body, headers)
+        except (http.client.HTTPException, OSError):
+            status, data = 599, b""
+        self.latencies.setdefault(op, []).append(time.perf_counter() - start)
+        if status >= 400:
+            self.errors += 1
+            return None
+        return data
+    
+    def call_json(self, op, method, path, body=None, headers=None):
+        data = self.call(op, method, path, body, headers)
+        return json.loads(data) if data else None
+
+
+# ----- scenarios -----
+def login_setup(session):
+    return {}
+
+
+def login_step(session, state, worker):
+    user = session.call_json("quick-login", "POST", "/api/quick-login")
+    if user is not None:
+        session.call("heartbeat", "POST", "/api/presence/heartbeat", {"session_id": user["session_id"]})
+
+
+def chat_setup(session):
+    return {}
+
+
+def chat_step(session, state, worker):
+    room = ROOMS[worker % len(ROOMS)]
+    if worker % 4 == 3:
+        since = state.setdefault(("since", worker), 0)
+        page = session.call_json("poll", "GET", f"/api/chat/messages?room={room}&since={since}&limit=100")
+        if page is not None:
+            state[("since", worker)] = page["last_seq"]
+    else:
+        session.call("send", "POST", "/api/chat/send", {
+            "room": room, "username": f"load_{worker}", "message": f"msg {session.rng.random():.6f}"
+        })
+
+
+def tournament_setup(session):
+    players = []
+    for _ in range(TOP_PLAYERS):
+        user = session.call_json("quick-login", "POST", "/api/quick-login")
+        players.append(user["session_id"])
+    return {"players": players}
+
+
+def solve_ctf(data):
+    return base64.b64decode(codecs.decode(bytes.fromhex(data).decode(), "rot13")).decode()
+
+
+def tournament_step(session, state, worker):
+    player = session.rng.choice(state["players"])
+    game = session.call_json("start-game", "GET", f"/api/games/ctf?session_id={player}")
+    if game is not None:
+        session.call("submit-score", "POST", "/api/games/ctf", {
+            "id": game["id"], "score": session.rng.randint(1, 200),
+            "session_id": player, "answer": solve_ctf(game["data"])
+        })
+
+
+def landing_setup(session):
+    return {}
+
+
+LANDING_PAGES = [
+    ("index", "/", {"Accept-Encoding": "br, gzip"}),
+    ("stats", "/api/stats", None),
+    ("leaderboard", "/api/leaderboard?limit=10", None),
+    ("games", "/games", None),
+]
+
+
+def landing_step(session, state, worker):
+    op, path, headers = session.rng.choice(LANDING_PAGES)
+    session.call(op, "GET", path, headers=headers)
+
+
+def bootstrap_setup(session):
+    return {}
+
+
+BOOTSTRAP_OPS = [
+    {"op": "stats"},
+    {"op": "leaderboard", "limit": 10},
+    {"op": "health"},
+    {"op": "chat.messages", "room": "#general", "limit": 20},
+]
+
+
+def bootstrap_step(session, state, worker):
+    session.call("batch", "POST", "/api/batch", {"ops": BOOTSTRAP_OPS})
+
+
+def terminal_setup(session):
+    user = session.call_json("quick-login", "POST", "/api/quick-login")
+    return {"session_id": user["session_id"]}
+
+
+TERMINAL_SCRIPT = ["whoami", "ls", "scan 10.0.0.0/24", "decode secret.enc", "crack 5f4dcc3b5aa765d61d8327deb882cf99"]
+
+
+def terminal_step(session, state, worker):
+    session.call("batch", "POST", "/api/batch", {
+        "session_id": state["session_id"],
+        "ops": [{"op": "terminal.execute", "command": command} for command in TERMINAL_SCRIPT]
+    })
+
+
+SCENARIOS = {
+    "login": (login_setup, login_step),
+    "chat": (chat_setup, chat_step),
+    "tournament": (tournament_setup, tournament_step),
+    "landing": (landing_setup, landing_step),
+    "bootstrap": (bootstrap_setup, bootstrap_step),
+    "terminal": (terminal_setup, terminal_step),
+}
+
+
+# ----- measurement -----
+def percentile(samples, pct):
+    return samples[min(len(samples) - 1, int(len(samples) * pct / 100))] if samples else 0.0
+
+
+def summarize(samples):
+    samples = sorted(samples)
+    return {
+        "count": len(samples),
+        "p50_ms": round(percentile(samples, 50) * 1e3, 3),
+        "p95_ms": round(percentile(samples, 95) * 1e3, 3),
+        "p99_ms": round(percentile(samples, 99) * 1e3, 3),
+    }
+
+
+def rss_kb(pid):
+    """Resident set size of pid and all its descendants, from /proc (Linux only)"""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            rss = next(int(line.split()[1]) for line in f if line.startswith("VmRSS:"))
+        with open(f"/proc/{pid}/task/{pid}/children") as f:
+            children = [int(child) for child in f.read().split()]
+    except (OSError, StopIteration):
+        return None
+    return rss + sum(rss_kb(child) or 0 for child in children)
+
+
+def run_scenario(name, make_client, concurrency, duration, server_pid):
+    setup, step = SCENARIOS[name]
+    state = setup(Session(make_client()))
+    sessions = [Session(make_client()) for _ in range(concurrency)]
+    barrier = threading.Barrier(concurrency + 1)
+    stop = threading.Event()
+    
+    def worker(n):
+        barrier.wait()
+        while not stop.is_set():
+            step(sessions[n], state, n)
+    
+    threads = [threading.Thread(target=worker, args=(n,), daemon=True) for n in range(concurrency)]
+    for t in threads:
+        t.start()
+    barrier.wait()
+    started = time.perf_counter()
+    time.sleep(duration)
+    stop.set()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+    
+    ops = {}
+    for session in sessions:
+        for op, samples in session.latencies.items():
+            ops.setdefault(op, []).extend(samples)
+    everything = [sample for samples in ops.values() for sample in samples]
+    rss = rss_kb(server_pid)
+    result = summarize(everything)
+    result.update({
+        "rps": round(len(everything) / elapsed, 1),
+        "errors": sum(session.errors for session in sessions),
+        "rss_mb": round(rss / 1024, 1) if rss else None,
+        "ops": {op: summarize(samples) for op, samples in sorted(ops.items())},
+    })
+    return result
+
+
+# ----- gunicorn -----
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def spawn_gunicorn(workers, threads, storage):
+    port = free_port()
+    env = dict(os.environ)
+    if storage:
+        env["HACKARENA_STORAGE"] = storage
+    server = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "--chdir", API_DIR, "-w", str(workers), "--threads", str(threads),
+         "-b", f"127.0.0.1:{port}", "--log-level", "warning", "index:app"],
+        env=env
+    )
+    client = HTTPClient("127.0.0.1", port)
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        if server.poll() is not None:
+            raise SystemExit(f"gunicorn exited with status {server.returncode}")
+        try:
+            if client.request("GET", "/api/health")[0] == 200:
+                return server, port
+        except OSError:
+            time.sleep(0.2)
+    server.terminate()
+    raise SystemExit("gunicorn did not become ready within 30s")
+
+
+# ----- baseline comparison -----
+def compare(results, baseline, threshold):
+    """Regression messages for scenarios slower than baseline by more than threshold"""
+    regressions = []
+    for name, current in results["scenarios"].items():
+        previous = baseline.get("scenarios", {}).get(name)
+        if previous is None:
+            continue
+        if previous["rps"] and current["rps"] < previous["rps"] * (1 - threshold):
+            regressions.append(f"{name}: throughput {current['rps']} rps < baseline {previous['rps']} rps")
+        if previous["p95_ms"] and current["p95_ms"] > previous["p95_ms"] * (1 + threshold):
+            regressions.append(f"{name}: p95 {current['p95_ms']} ms > baseline {previous['p95_ms']} ms")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--target', choices=["inprocess", "gunicorn"], default="inprocess")
+    parser.add_argument('--scenarios', default=",".join(SCENARIOS))
+    parser.add_argument('--duration', type=float, default=10, help="seconds per scenario")
+    parser.add_argument('--concurrency', type=int, default=16, help="client threads")
+    parser.add_argument('--workers', type=int, default=2, help="gunicorn worker processes")
+    parser.add_argument('--threads', type=int, default=8, help="gunicorn threads per worker")
+    parser.add_argument('--storage', help="HACKARENA_STORAGE for gunicorn (default: a temporary SQLite "
+                                          "database when --workers > 1)")
+    parser.add_argument('--rate-limit', action='store_true',
+                        help="keep per-client rate limits on (all load comes from one address)")
+    parser.add_argument('--output', help="write results as JSON")
+    parser.add_argument('--baseline', help="compare against a previous --output file")
+    parser.add_argument('--threshold', type=float, default=0.15, help="allowed relative regression")
+    args = parser.parse_args()
+    
+    os.environ.setdefault("HACKARENA_RATE_LIMIT", "1" if args.rate_limit else "0")
+    names = [name for name in args.scenarios.split(",") if name]
+    unknown = set(names) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+    
+    server = None
+    with tempfile.TemporaryDirectory() as directory:
+        if args.target == "gunicorn":
+            storage = args.storage
+            if storage is None and args.workers > 1:
+                storage = f"sqlite:{os.path.join(directory, 'loadtest.db')}"
+            server, port = spawn_gunicorn(args.workers, args.threads, storage)
+            server_pid = server.pid
+            make_client = lambda: HTTPClient("127.0.0.1", port)
+        else:
+            server_pid = os.getpid()
+            make_client = InProcessClient
+    
+        results = {
+            "target": args.target,
+            "concurrency": args.concurrency,
+            "duration": args.duration,
+            "workers": args.workers if server else None,
+            "timestamp": time.time(),
+            "scenarios": {},
+        }
+        try:
+            print(f"{'scenario':<12}{'rps':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errors':>8}{'rss MB':>9}")
+            for name in names:
+                result = run_scenario(name, make_client, args.concurrency, args.duration, server_pid)
+                results["scenarios"][name] = result
+                print(f"{name:<12}{result['rps']:>10.1f}{result['p50_ms']:>10.2f}{result['p95_ms']:>10.2f}"
+                      f"{result['p99_ms']:>10.2f}{result['errors']:>8}{result['rss_mb'] or 0:>9.1f}")
+        finally:
+            if server is not None:
+                server.terminate()
+                server.wait()
+    
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        for regression in regressions:
+            print(f"REGRESSION: {regression}")
+        print("FAIL" if regressions else f"OK: within {args.threshold:.0%} of baseline")
+        sys.exit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+"""Per-request cost of the request metrics hooks, instrumentation on vs off.
+
+Times the before_request/after_request pair directly inside one request
+context (the pure instrumentation cost), then whole requests through the
+Flask test client with request_metrics enabled and disabled.
+
+Usage: python benchmarks/metrics_overhead.py [--requests 20000] [--path /api/health] [--rounds 3]
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'api'))
+
+from flask import Response
+
+from index import app, request_metrics
+
+
+def hook_cost(n, path):
+    """Microseconds per before/after hook pair"""
+    response = Response(b"{}", mimetype='application/json')
+    with app.test_request_context(path):
+        started = time.perf_counter()
+        for _ in range(n):
+            request_metrics.before_request()
+            request_metrics.after_request(response)
+        return (time.perf_counter() - started) / n * 1e6
+
+
+def request_cost(n, path):
+    """Microseconds per request through the test client"""
+    client = app.test_client()
+    for _ in range(min(n, 500)):
+        client.get(path)
+    started = time.perf_counter()
+    for _ in range(n):
+        client.get(path)
+    return (time.perf_counter() - started) / n * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=20000)
+    parser.add_argument('--path', default='/api/health')
+    parser.add_argument('--rounds', type=int, default=3)
+    args = parser.parse_args()
+    
+    # Alternate on/off rounds and keep the best of each to damp warm-up and noise
+    results = {False: (float("inf"), float("inf")), True: (float("inf"), float("inf"))}
+    for _ in range(args.rounds):
+        for enabled in (False, True):
+            request_metrics.enabled = enabled
+            hooks = hook_cost(args.requests * 5, args.path)
+            whole = request_cost(args.requests, args.path)
+            results[enabled] = (min(results[enabled][0], hooks), min(results[enabled][1], whole))
+    
+    print(f"{'instrumentation':<16} {'hooks us/req':>13} {'request us/req':>15}")
+    for enabled, (hooks, whole) in results.items():
+        print(f"{'on' if enabled else 'off':<16} {hooks:>13.2f} {whole:>15.1f}")
+    print(f"overhead: {results[True][0] - results[False][0]:.2f} us/request (hooks), "
+          f"{results[True][1] - results[False][1]:+.1f} us/request (end to end)")
+
+
+if __name__ == '__main__':
+    main()
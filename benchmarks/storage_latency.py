@@ -0,0 +1,65 @@
+"""Per-operation read/write latency for each HackArenaDB storage backend.
+
+Usage: python benchmarks/storage_latency.py [--ops 2000]
+"""
+import argparse
+import os
+import secrets
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'api'))
+
+from index import HackArenaDB, MemoryStore, SQLiteStore, player_id
+
+
+def percentile(samples, pct):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * pct / 100))]
+
+
+def measure(db, ops):
+    user_ids = [secrets.token_hex(16) for _ in range(ops)]
+    player_ids = [player_id(user_id) for user_id in user_ids]
+    operations = [
+        ("add_user", lambda i: db.add_user(user_ids[i], {
+            "username": f"ghost_{i}", "points": 0, "rank": "👤 Ghost", "level": 1, "created": time.time()
+        })),
+        ("add_points", lambda i: db.add_points(user_ids[i], i % 97)),
+        ("post_message", lambda i: db.post_message("#bench", {"id": str(i), "message": "hello"})),
+        ("get_user", lambda i: db.get_user(user_ids[i])),
+        ("leaderboard_top(100)", lambda i: db.leaderboard_top(100)),
+        ("leaderboard_rank", lambda i: db.leaderboard_rank(player_ids[i])),
+        ("read_messages(since)", lambda i: db.read_messages("#bench", ops - 10, 50)),
+    ]
+    
+    results = []
+    for name, op in operations:
+        samples = []
+        for i in range(ops):
+            start = time.perf_counter()
+            op(i)
+            samples.append(time.perf_counter() - start)
+        results.append((name, percentile(samples, 50), percentile(samples, 99)))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--ops', type=int, default=2000, help="operations per measurement")
+    args = parser.parse_args()
+    
+    with tempfile.TemporaryDirectory() as directory:
+        backends = [
+            ("memory", lambda: MemoryStore()),
+            ("sqlite (WAL)", lambda: SQLiteStore(os.path.join(directory, "hackarena.db"))),
+        ]
+        print(f"{'backend':<14}{'operation':<24}{'p50 us':>10}{'p99 us':>10}")
+        for backend, factory in backends:
+            for name, p50, p99 in measure(HackArenaDB(factory()), args.ops):
+                print(f"{backend:<14}{name:<24}{p50 * 1e6:>10.1f}{p99 * 1e6:>10.1f}")
+
+
+if __name__ == '__main__':
+    main()
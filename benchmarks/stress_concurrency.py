@@ -0,0 +1,93 @@
+"""Concurrency stress check for HackArenaDB write paths.
+
+Hammers score submission and chat sends through the Flask app from many
+threads and verifies that no point increment or chat message was lost.
+Exits non-zero on any lost update.
+
+Usage: python benchmarks/stress_concurrency.py [--threads 32] [--ops 300]
+"""
+import argparse
+import base64
+import codecs
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'api'))
+# Every thread shares one client address; this checks correctness, not throttling
+os.environ.setdefault('HACKARENA_RATE_LIMIT', '0')
+
+from index import app, db, player_id
+
+
+def solve_ctf(data):
+    return base64.b64decode(codecs.decode(bytes.fromhex(data).decode(), "rot13")).decode()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--threads', type=int, default=32)
+    parser.add_argument('--ops', type=int, default=300, help="operations per thread")
+    parser.add_argument('--users', type=int, default=8, help="players sharing the score load")
+    args = parser.parse_args()
+    
+    # Force frequent thread switches so unsynchronized read-modify-writes would race
+    sys.setswitchinterval(1e-6)
+    
+    client = app.test_client()
+    sessions = [client.post('/api/quick-login').get_json()["session_id"] for _ in range(args.users)]
+    rooms = ["#stress-a", "#stress-b"]
+    start_seq = {room: db.read_messages(room, None, 0)[1] for room in rooms}
+    barrier = threading.Barrier(args.threads)
+    
+    def worker(n):
+        c = app.test_client()
+        barrier.wait()
+        for i in range(args.ops):
+            if i % 2:
+                player = sessions[(n + i) % args.users]
+                game = c.get(f'/api/games/ctf?session_id={player}').get_json()
+                c.post('/api/games/ctf', json={
+                    "id": game["id"], "session_id": player, "score": 1, "answer": solve_ctf(game["data"])
+                })
+            else:
+                c.post('/api/chat/send', json={"room": rooms[(n + i) % 2], "username": f"t{n}", "message": str(i)})
+    
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(args.threads)]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+    
+    failures = []
+    expected_points = args.threads * (args.ops // 2)
+    points = sum(db.get_user(s)["points"] for s in sessions)
+    ranked = sum(db.leaderboard_rank(player_id(s))[0]["points"] for s in sessions)
+    if points != expected_points:
+        failures.append(f"user points {points} != {expected_points}")
+    if ranked != expected_points:
+        failures.append(f"leaderboard points {ranked} != {expected_points}")
+    
+    expected_messages = args.threads * (args.ops - args.ops // 2)
+    sent = sum(db.read_messages(room, None, 0)[1] - start_seq[room] for room in rooms)
+    if sent != expected_messages:
+        failures.append(f"chat messages {sent} != {expected_messages}")
+    for room in rooms:
+        seqs = [m["seq"] for m in db.read_messages(room, None, 1000)[0]]
+        if seqs != list(range(seqs[0], seqs[0] + len(seqs))):
+            failures.append(f"{room} ring has gaps or duplicates")
+    
+    total = args.threads * args.ops
+    print(f"{total} requests from {args.threads} threads in {elapsed:.2f}s ({total / elapsed:.0f} req/s)")
+    for failure in failures:
+        print(f"LOST UPDATE: {failure}")
+    print(f"score batches: {db.scores.stats()}")
+    print("FAIL" if failures else "OK: no lost updates")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
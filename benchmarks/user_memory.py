@@ -0,0 +1,87 @@
+"""Memory per anonymous user: dict records vs the columnar UserTable.
+
+Each layout is built in a fresh interpreter holding --users ghost accounts
+shaped like quick-login's, and its RSS growth is divided by the user count.
+Session ids and usernames are allocated before measuring, since every
+layout keeps those same strings. "store" adds users through
+MemoryStore.add_user, so it also counts the leaderboard index and session
+expiry entries each login creates.
+
+Usage: python benchmarks/user_memory.py [--users 1000000] [--layouts dict,table,store]
+"""
+import argparse
+import gc
+import os
+import secrets
+import subprocess
+import sys
+import time
+
+API_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'api')
+
+LAYOUTS = ("dict", "table", "store")
+
+
+def rss_kb():
+    with open("/proc/self/status") as f:
+        return next(int(line.split()[1]) for line in f if line.startswith("VmRSS:"))
+
+
+def measure(layout, count):
+    """(bytes per user, microseconds per get) for one layout, in this process"""
+    sys.path.insert(0, API_DIR)
+    import index
+
+    ids = [secrets.token_hex(16) for _ in range(count)]
+    names = [f"ghost_{secrets.token_hex(4)}" for _ in range(count)]
+    gc.collect()
+    before = rss_kb()
+
+    if layout == "dict":
+        users = {}
+        for user_id, name in zip(ids, names):
+            users[user_id] = {"username": name, "points": 0, "rank": "👤 Ghost", "level": 1, "created": time.time()}
+        get = users.get
+    elif layout == "table":
+        users = index.UserTable()
+        for user_id, name in zip(ids, names):
+            users.put(user_id, {"username": name, "points": 0, "rank": "👤 Ghost", "level": 1, "created": time.time()})
+        get = users.get
+    else:
+        store = index.MemoryStore(max_sessions=count * 2)
+        for user_id, name in zip(ids, names):
+            store.add_user(user_id, {"username": name, "points": 0, "rank": "👤 Ghost", "level": 1, "created": time.time()})
+        get = store.get_user
+
+    gc.collect()
+    per_user = (rss_kb() - before) * 1024 / count
+    sample = ids[:100000]
+    started = time.perf_counter()
+    for user_id in sample:
+        get(user_id)
+    return per_user, (time.perf_counter() - started) / len(sample) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=1000000)
+    parser.add_argument('--layouts', default=",".join(LAYOUTS))
+    parser.add_argument('--child', choices=LAYOUTS, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(*measure(args.child, args.users))
+        return
+
+    print(f"{'layout':<8}{'bytes/user':>12}{'get us':>9}{'total MB':>10}")
+    for layout in args.layouts.split(","):
+        child = subprocess.run(
+            [sys.executable, __file__, "--child", layout, "--users", str(args.users)],
+            capture_output=True, text=True, check=True
+        )
+        per_user, get_us = map(float, child.stdout.split()[-2:])
+        print(f"{layout:<8}{per_user:>12.0f}{get_us:>9.2f}{per_user * args.users / 2**20:>10.1f}")
+
+
+if __name__ == '__main__':
+    main()
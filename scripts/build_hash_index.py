@@ -0,0 +1,134 @@
+"""Build the memory-mapped hash lookup index used by `crack` and password_cracker.
+
+Reads a wordlist, expands every word with mangling rules, and writes
+data/hashindex/{words.dat,md5.idx,sha1.idx,sha256.idx} in the format read
+by HashIndex in api/index.py. Hashing runs in a process pool over batches
+of candidates. Each batch is written as a sorted run, and the runs are
+merged into the final index, so memory stays bounded even for large
+wordlists.
+
+Usage: python scripts/build_hash_index.py [wordlist] [--out DIR] [--rules basic|none] [--workers N]
+"""
+import argparse
+import hashlib
+import heapq
+import os
+import struct
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+ROOT = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+ALGORITHMS = {"md5": 16, "sha1": 20, "sha256": 32}
+LEET = str.maketrans("aeiost", "431057")
+SUFFIXES = ("1", "12", "123", "1234", "!", "01", "69", "007", "2023", "2024", "2025")
+
+
+def mangle(word, rules):
+    """Candidate plaintexts for one word, without duplicates"""
+    if rules == "none":
+        return [word]
+    bases = [word, word.capitalize(), word.upper(), word.translate(LEET)]
+    candidates = bases + [base + suffix for base in bases[:2] for suffix in SUFFIXES]
+    candidates += [word + str(d) for d in range(10)]
+    return list(dict.fromkeys(candidates))
+
+
+def hash_batch(batch, run_dir, batch_no):
+    """Hash one batch with every algorithm and write one sorted run per algorithm"""
+    pack = struct.Struct("<I").pack
+    runs = {}
+    for name in ALGORITHMS:
+        new = getattr(hashlib, name)
+        records = sorted([new(word).digest() + pack(offset) for offset, word in batch])
+        path = os.path.join(run_dir, f"{name}.{batch_no:06d}.run")
+        with open(path, 'wb') as f:
+            f.write(b"".join(records))
+        runs[name] = path
+    return runs
+
+
+def read_run(path, stride, chunk=1 << 16):
+    with open(path, 'rb') as f:
+        while True:
+            data = f.read(stride * chunk)
+            if not data:
+                return
+            for i in range(0, len(data), stride):
+                yield data[i:i + stride]
+
+
+def merge_runs(runs, stride, path):
+    with open(path, 'wb') as f:
+        for record in heapq.merge(*(read_run(run, stride) for run in runs)):
+            f.write(record)
+
+
+def build(wordlist, out_dir, rules, workers, batch_size):
+    os.makedirs(out_dir, exist_ok=True)
+    runs = {name: [] for name in ALGORITHMS}
+    candidates = 0
+    
+    with tempfile.TemporaryDirectory(dir=out_dir) as run_dir, \
+            ProcessPoolExecutor(max_workers=workers) as pool, \
+            open(os.path.join(out_dir, "words.dat.tmp"), 'wb') as words, \
+            open(wordlist, 'rb') as source:
+        futures = []
+        batch = []
+        offset = 0
+        for line in source:
+            word = line.rstrip(b"\r\n").decode('utf-8', 'ignore')
+            if not word:
+                continue
+            for candidate in mangle(word, rules):
+                raw = candidate.encode()
+                if b"\n" in raw:
+                    continue
+                words.write(raw + b"\n")
+                batch.append((offset, raw))
+                offset += len(raw) + 1
+                if len(batch) >= batch_size:
+                    futures.append(pool.submit(hash_batch, batch, run_dir, len(futures)))
+                    candidates += len(batch)
+                    batch = []
+        if batch:
+            futures.append(pool.submit(hash_batch, batch, run_dir, len(futures)))
+            candidates += len(batch)
+        if offset >= 1 << 32:
+            sys.exit("words.dat exceeds the 4 GiB offset range; split the wordlist")
+        
+        for future in futures:
+            for name, path in future.result().items():
+                runs[name].append(path)
+        
+        # One k-way merge per algorithm, run side by side in the pool
+        merges = [
+            pool.submit(merge_runs, runs[name], width + 4, os.path.join(out_dir, f"{name}.idx.tmp"))
+            for name, width in ALGORITHMS.items()
+        ]
+        for future in merges:
+            future.result()
+    
+    for name in ["words.dat"] + [f"{name}.idx" for name in ALGORITHMS]:
+        os.replace(os.path.join(out_dir, name + ".tmp"), os.path.join(out_dir, name))
+    return candidates
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('wordlist', nargs='?', default=os.path.join(ROOT, 'data', 'wordlist.txt'))
+    parser.add_argument('--out', default=os.path.join(ROOT, 'data', 'hashindex'))
+    parser.add_argument('--rules', choices=('basic', 'none'), default='basic')
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--batch-size', type=int, default=50000)
+    args = parser.parse_args()
+    
+    start = time.perf_counter()
+    candidates = build(args.wordlist, args.out, args.rules, args.workers, args.batch_size)
+    elapsed = time.perf_counter() - start
+    print(f"Indexed {candidates} candidates x {len(ALGORITHMS)} algorithms into {args.out} in {elapsed:.1f}s")
+
+
+if __name__ == '__main__':
+    main()
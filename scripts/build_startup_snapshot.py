@@ -0,0 +1,48 @@
+"""Prebuild the optional startup snapshot loaded by api/index.py at import.
+
+Writes data/startup.json with the seed data and the landing page compressed
+at the highest gzip and brotli levels, keyed to a digest of api/index.py.
+A cold start that finds a matching snapshot seeds from it and skips
+compressing the page at import; after any edit to index.py the snapshot is
+ignored until it is rebuilt. Include the file in the deployment to use it.
+
+Usage: python scripts/build_startup_snapshot.py [--out data/startup.json]
+"""
+import argparse
+import base64
+import json
+import os
+import sys
+
+ROOT = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+sys.path.insert(0, os.path.join(ROOT, 'api'))
+
+import index
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--out', default=os.path.normpath(index.STARTUP_SNAPSHOT))
+    args = parser.parse_args()
+    
+    pages = {
+        "/": {
+            encoding: base64.b64encode(body).decode()
+            for encoding, body in index.StaticPage.compress(index.render_main_page()).items()
+        }
+    }
+    snapshot = {
+        "source": index.source_digest(),
+        "seed": index.HackArenaDB.default_seed(),
+        "pages": pages
+    }
+    
+    os.makedirs(os.path.dirname(args.out), exist_ok=True)
+    with open(args.out + ".tmp", 'w') as f:
+        json.dump(snapshot, f, ensure_ascii=False)
+    os.replace(args.out + ".tmp", args.out)
+    print(f"Wrote {args.out} ({os.path.getsize(args.out)} bytes, pages: {', '.join(pages['/'])})")
+
+
+if __name__ == '__main__':
+    main()